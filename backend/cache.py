@@ -0,0 +1,356 @@
+"""
+Two-tier caching system: a bounded in-process L1 over an optional shared L2
+"""
+
+from abc import ABC, abstractmethod
+import asyncio
+import inspect
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def approximate_size(value: Any, _depth: int = 0) -> int:
+    """Rough deep size in bytes of a cached value (containers up to a few levels)"""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(
+            approximate_size(k, _depth + 1) + approximate_size(v, _depth + 1)
+            for k, v in value.items()
+        )
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, _depth + 1) for item in value)
+    elif getattr(value, 'base', None) is not None and hasattr(value, 'nbytes'):
+        # getsizeof already counts the data of arrays that own it, but not of views
+        size += value.nbytes
+    return size
+
+
+class CacheBackend(ABC):
+    """Shared cache tier reachable from every worker process
+
+    Values are opaque bytes and expiry is a wall-clock timestamp, since
+    monotonic clocks are not comparable across processes.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Return (value, expires_at) or None if missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float):
+        """Store value for ttl seconds"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove key if present"""
+
+    @abstractmethod
+    def clear(self):
+        """Remove every entry"""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Shared cache in a local SQLite file, for workers on the same host"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            # Expired rows are only ever skipped by get, so trim them here now and then
+            if hash(key) % 64 == 0:
+                self._conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared cache on a Redis server, for workers across hosts
+
+    Uses the blocking client, so async callers go through Cache.aget/aset,
+    which run backend calls in a thread.
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "airsense:", client=None):
+        if client is None:
+            import redis  # optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        pipe = self._client.pipeline()
+        pipe.get(self._prefix + key)
+        pipe.pttl(self._prefix + key)
+        value, ttl_ms = pipe.execute()
+        if value is None:
+            return None
+        return value, time.time() + max(ttl_ms, 0) / 1000
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._client.set(self._prefix + key, value, px=max(int(ttl * 1000), 1))
+
+    def delete(self, key: str):
+        self._client.delete(self._prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self._prefix + "*"):
+            self._client.delete(key)
+
+
+def create_backend(url: Optional[str]) -> Optional[CacheBackend]:
+    """Build a shared cache backend from sqlite:///path or redis:// URLs"""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteCacheBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported cache backend URL: {url}")
+
+
+class Cache:
+    """Two-tier cache: in-memory LRU with per-entry TTL over an optional shared L2
+
+    L1 entries expire on a monotonic clock and are checked lazily on access.
+    Once max_entries or the approximate max_bytes is exceeded, the least
+    recently used entries are evicted in O(1) each. With an L2 backend, writes
+    go to both tiers and L1 misses are filled from L2, so workers share results.
+    L2 backends do blocking I/O: async code uses aget/aset, which run it in a
+    thread and touch L1 only from the event loop.
+    """
+
+    def __init__(self, default_ttl: Optional[int] = None,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 l2: Optional[CacheBackend] = None):
+        self.default_ttl = default_ttl or int(os.getenv("CACHE_TTL", 3600))
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+        self.max_bytes = max_bytes or int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+        # key -> (value, expiry, size), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self.current_bytes = 0
+        self.stats = Counter()
+        self.l2 = l2
+
+    def _l2_key(self, key: Hashable) -> str:
+        return key if isinstance(key, str) else repr(key)
+
+    def _generate_key(self, *args, **kwargs) -> Hashable:
+        """Generate cache key from arguments, falling back to repr for unhashable ones"""
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        try:
+            hash(key)
+        except TypeError:
+            key = repr(key)
+        return key
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[int] = None):
+        """Set cache value with TTL"""
+        if ttl is None:
+            ttl = self.default_ttl
+
+        self._set_local(key, value, ttl)
+        if self.l2 is not None:
+            self._write_shared(key, value, ttl)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[int] = None):
+        """set() for async callers, writing L2 from a thread"""
+        if ttl is None:
+            ttl = self.default_ttl
+
+        self._set_local(key, value, ttl)
+        if self.l2 is not None:
+            await asyncio.to_thread(self._write_shared, key, value, ttl)
+
+    def _write_shared(self, key: Hashable, value: Any, ttl: float):
+        try:
+            self.l2.set(self._l2_key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+        except Exception as e:
+            self.stats['l2_errors'] += 1
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def _set_local(self, key: Hashable, value: Any, ttl: float):
+        """Store a value in the in-process tier"""
+        size = approximate_size(value)
+        self._delete_local(key)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self.current_bytes += size
+
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.stats['evictions'] += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get cache value if not expired"""
+        value = self._get_local(key)
+        if value is None:
+            value = self.get_shared(key)
+            if value is None:
+                self.stats['misses'] += 1
+        return value
+
+    async def aget(self, key: Hashable) -> Optional[Any]:
+        """get() for async callers, reading L2 from a thread"""
+        value = self._get_local(key)
+        if value is None:
+            value = await self.aget_shared(key)
+            if value is None:
+                self.stats['misses'] += 1
+        return value
+
+    def _get_local(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expiry, _ = entry
+        if time.monotonic() <= expiry:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+        self._delete_local(key)
+        self.stats['expirations'] += 1
+        return None
+
+    def get_shared(self, key: Hashable) -> Optional[Any]:
+        """Look a key up in L2 only, copying a hit into L1 for its remaining lifetime"""
+        if self.l2 is None:
+            return None
+        return self._fill_local(key, self._read_shared(key))
+
+    async def aget_shared(self, key: Hashable) -> Optional[Any]:
+        """get_shared() for async callers, reading L2 from a thread"""
+        if self.l2 is None:
+            return None
+        return self._fill_local(key, await asyncio.to_thread(self._read_shared, key))
+
+    def _read_shared(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """(value, expires_at) from L2, or None if missing or unreachable"""
+        try:
+            entry = self.l2.get(self._l2_key(key))
+            if entry is None:
+                return None
+            raw, expires_at = entry
+            return pickle.loads(raw), expires_at
+        except Exception as e:
+            self.stats['l2_errors'] += 1
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+
+    def _fill_local(self, key: Hashable, entry: Optional[Tuple[Any, float]]) -> Optional[Any]:
+        if entry is None:
+            return None
+        value, expires_at = entry
+        self.stats['l2_hits'] += 1
+        self._set_local(key, value, max(expires_at - time.time(), 0))
+        return value
+
+    def _delete_local(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+    def delete(self, key: Hashable):
+        """Delete cache entry"""
+        self._delete_local(key)
+        if self.l2 is not None:
+            self.l2.delete(self._l2_key(key))
+
+    def clear(self):
+        """Clear all cache"""
+        self._entries.clear()
+        self.current_bytes = 0
+        if self.l2 is not None:
+            self.l2.clear()
+
+    def get_stats(self) -> Dict:
+        """Hit/miss/eviction counts and current occupancy"""
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'shared_backend': type(self.l2).__name__ if self.l2 is not None else None
+        }
+
+    def cached(self, ttl: Optional[int] = None, key: Optional[Callable[..., Hashable]] = None):
+        """Decorator for caching function results
+
+        Entries are keyed on the function's qualified name and its arguments,
+        leaving out self/cls, whose repr differs between processes, so every
+        worker shares the L2 entry. Pass key to build the key from the
+        arguments instead, e.g. when they have no stable repr.
+        """
+        def decorator(func):
+            parameters = list(inspect.signature(func).parameters)
+            skip = 1 if parameters and parameters[0] in ('self', 'cls') else 0
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if key is not None:
+                    cache_key = (func.__qualname__, key(*args, **kwargs))
+                else:
+                    cache_key = self._generate_key(func.__qualname__, *args[skip:], **kwargs)
+
+                # Check cache
+                cached_value = await self.aget(cache_key)
+                if cached_value is not None:
+                    return cached_value
+
+                # Call function
+                result = await func(*args, **kwargs)
+
+                # Store in cache
+                await self.aset(cache_key, result, ttl)
+
+                return result
+            return wrapper
+        return decorator
+
+
+# Global cache instance; CACHE_L2_URL (sqlite:///path or redis://...) enables the shared tier
+cache = Cache(l2=create_backend(os.getenv("CACHE_L2_URL")))
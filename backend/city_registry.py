@@ -0,0 +1,94 @@
+"""
+Immutable registry of monitored cities
+"""
+
+from types import MappingProxyType
+from typing import Dict, Iterator, Mapping, Optional
+
+import numpy as np
+
+# name: (lat, lng, population, base AQI from historical averages)
+CITIES = {
+    'Delhi': (28.7041, 77.1025, 30000000, 250),
+    'Mumbai': (19.0760, 72.8777, 20000000, 180),
+    'Bangalore': (12.9716, 77.5946, 12000000, 140),
+    'Kolkata': (22.5726, 88.3639, 14500000, 190),
+    'Chennai': (13.0827, 80.2707, 10000000, 130),
+    'Hyderabad': (17.3850, 78.4867, 10000000, 150),
+    'Pune': (18.5204, 73.8567, 7000000, 145),
+    'Ahmedabad': (23.0225, 72.5714, 8000000, 165),
+    'Jaipur': (26.9124, 75.7873, 3500000, 200),
+    'Lucknow': (26.8467, 80.9462, 3200000, 220)
+}
+
+# Baseline pollution source shares (%) for cities with surveyed attribution
+SOURCE_ATTRIBUTION = {
+    'Delhi': {'Vehicular': 38, 'Industrial': 25, 'Construction': 20, 'Biomass': 12, 'Other': 5},
+    'Mumbai': {'Vehicular': 42, 'Industrial': 22, 'Construction': 18, 'Biomass': 8, 'Other': 10},
+    'Bangalore': {'Vehicular': 45, 'Industrial': 18, 'Construction': 22, 'Biomass': 7, 'Other': 8},
+}
+DEFAULT_ATTRIBUTION = {'Vehicular': 35, 'Industrial': 28, 'Construction': 18, 'Biomass': 12, 'Other': 7}
+
+DEFAULT_BASE_AQI = 150
+
+
+def _read_only(values, dtype) -> np.ndarray:
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+class CityRegistry:
+    """City metadata stored column-wise, in a fixed order, with a name -> index lookup
+
+    Built once at import and never mutated: the columns are read-only arrays
+    and the lookups are mapping proxies, so every component can share them.
+    """
+
+    def __init__(self, cities: Dict[str, tuple]):
+        self.names = tuple(cities)
+        self.index: Mapping[str, int] = MappingProxyType({name: i for i, name in enumerate(self.names)})
+
+        lat, lng, population, base_aqi = zip(*cities.values())
+        self.lat = _read_only(lat, np.float64)
+        self.lng = _read_only(lng, np.float64)
+        self.population = _read_only(population, np.int64)
+        self.base_aqi = _read_only(base_aqi, np.float64)
+
+        # Per-city view in the shape of the old cities_config dicts
+        self.configs: Mapping[str, Mapping] = MappingProxyType({
+            name: MappingProxyType({
+                'lat': float(self.lat[i]), 'lng': float(self.lng[i]),
+                'population': int(self.population[i])
+            })
+            for name, i in self.index.items()
+        })
+        self.attribution: Mapping[str, Mapping] = MappingProxyType({
+            name: MappingProxyType(shares) for name, shares in SOURCE_ATTRIBUTION.items()
+        })
+        self.default_attribution: Mapping[str, int] = MappingProxyType(DEFAULT_ATTRIBUTION)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def get_index(self, name: str) -> Optional[int]:
+        return self.index.get(name)
+
+    def get_base_aqi(self, name: str) -> float:
+        """Historical average AQI, or DEFAULT_BASE_AQI for unknown cities"""
+        i = self.index.get(name)
+        return DEFAULT_BASE_AQI if i is None else float(self.base_aqi[i])
+
+    def get_attribution(self, name: str) -> Mapping[str, int]:
+        """Baseline source shares, falling back to the national default"""
+        return self.attribution.get(name, self.default_attribution)
+
+
+# Global city registry
+city_registry = CityRegistry(CITIES)
@@ -1,84 +1,169 @@
-import aiohttp
 import asyncio
 import numpy as np
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import os
-import json
 from dotenv import load_dotenv
+from cache import cache
+from http_client import HTTPClient, http_client
+from city_registry import city_registry
 
 load_dotenv()
 
+# Timestamps are UTC, the clock the aqi_readings partitions are cut on; traffic
+# and seasonal patterns follow Indian Standard Time
+IST_OFFSET = timedelta(hours=5, minutes=30)
+
+# Pollutants derived from a snapshot's AQI: ratio to AQI and integer noise range
+POLLUTANT_PROFILE = {
+    'pm25': (0.6, 10), 'pm10': (0.8, 15), 'no2': (0.15, 5),
+    'so2': (0.08, 3), 'o3': (0.12, 5)
+}
+
+# data.gov.in pollutant_id -> reading field
+CPCB_POLLUTANTS = {
+    'PM2.5': 'pm25', 'PM10': 'pm10', 'NO2': 'no2',
+    'SO2': 'so2', 'CO': 'co', 'OZONE': 'o3'
+}
+
+# CPCB National AQI breakpoints: concentration (ug/m3, CO in mg/m3) at the
+# bounds of the Good, Satisfactory, Moderate, Poor, Very Poor and Severe bands
+AQI_BREAKPOINTS = (0, 50, 100, 200, 300, 400, 500)
+CPCB_BREAKPOINTS = {
+    'pm25': (0, 30, 60, 90, 120, 250, 380),
+    'pm10': (0, 50, 100, 250, 350, 430, 510),
+    'no2': (0, 40, 80, 180, 280, 400, 520),
+    'so2': (0, 40, 80, 380, 800, 1600, 2100),
+    'co': (0, 1, 2, 10, 17, 34, 46),
+    'o3': (0, 50, 100, 168, 208, 748, 1000)
+}
+
+
+def sub_index(pollutant: str, concentration: float) -> float:
+    """CPCB sub-index of a pollutant concentration, interpolated within its band (capped at 500)"""
+    return float(np.interp(concentration, CPCB_BREAKPOINTS[pollutant], AQI_BREAKPOINTS))
+
 class CPCBDataFetcher:
     """Fetch air quality data from CPCB and other sources"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[HTTPClient] = None):
+        self.http = client or http_client
         self.cpcb_api_key = os.getenv("CPCB_API_KEY", "")
         self.base_url = "https://api.data.gov.in/resource/3b01bcb8-0b14-4abf-b6f2-c1bfd384ba69"
-        self.cities_config = self._load_cities_config()
-        
-    def _load_cities_config(self):
-        """Load city configurations"""
-        return {
-            'Delhi': {'lat': 28.7041, 'lng': 77.1025, 'population': 30000000},
-            'Mumbai': {'lat': 19.0760, 'lng': 72.8777, 'population': 20000000},
-            'Bangalore': {'lat': 12.9716, 'lng': 77.5946, 'population': 12000000},
-            'Kolkata': {'lat': 22.5726, 'lng': 88.3639, 'population': 14500000},
-            'Chennai': {'lat': 13.0827, 'lng': 80.2707, 'population': 10000000},
-            'Hyderabad': {'lat': 17.3850, 'lng': 78.4867, 'population': 10000000},
-            'Pune': {'lat': 18.5204, 'lng': 73.8567, 'population': 7000000},
-            'Ahmedabad': {'lat': 23.0225, 'lng': 72.5714, 'population': 8000000},
-            'Jaipur': {'lat': 26.9124, 'lng': 75.7873, 'population': 3500000},
-            'Lucknow': {'lat': 26.8467, 'lng': 80.9462, 'population': 3200000}
-        }
+        self.cities = city_registry
+        self.cities_config = city_registry.configs
+        self.snapshot_ttl = float(os.getenv("REALTIME_SNAPSHOT_TTL", 60))
     
     async def fetch_realtime(self) -> List[Dict]:
         """Fetch real-time AQI data for all cities"""
         try:
-            # In production, this would make actual API calls
-            # For now, generating realistic mock data
-            data = []
-            for city, config in self.cities_config.items():
-                # Generate realistic AQI based on city patterns
-                base_aqi = self._get_city_base_aqi(city)
-                time_factor = self._get_time_factor()
-                seasonal_factor = self._get_seasonal_factor()
-                
-                aqi = int(base_aqi * time_factor * seasonal_factor + np.random.randint(-20, 20))
-                aqi = max(50, min(450, aqi))  # Keep within realistic bounds
-                
-                reading = {
+            snapshot = await self._get_snapshot()
+            columns = {
+                name: snapshot[name].tolist()
+                for name in ('aqi', *POLLUTANT_PROFILE, 'co', 'lat', 'lng')
+            }
+            return [
+                {
                     "city": city,
-                    "aqi": aqi,
-                    "pm25": int(aqi * 0.6 + np.random.randint(-10, 10)),
-                    "pm10": int(aqi * 0.8 + np.random.randint(-15, 15)),
-                    "no2": int(aqi * 0.15 + np.random.randint(-5, 5)),
-                    "so2": int(aqi * 0.08 + np.random.randint(-3, 3)),
-                    "co": round(aqi * 0.01 + np.random.uniform(-0.5, 0.5), 2),
-                    "o3": int(aqi * 0.12 + np.random.randint(-5, 5)),
-                    "timestamp": datetime.now().isoformat(),
-                    "lat": config['lat'],
-                    "lng": config['lng']
+                    **{name: values[i] for name, values in columns.items()},
+                    "timestamp": snapshot['timestamp']
                 }
-                data.append(reading)
-            
-            return data
+                for i, city in enumerate(snapshot['cities'])
+            ]
         except Exception as e:
             print(f"Error fetching real-time data: {e}")
             return []
     
-    def _get_city_base_aqi(self, city: str) -> int:
-        """Get base AQI for city (historical averages)"""
-        city_averages = {
-            'Delhi': 250, 'Mumbai': 180, 'Bangalore': 140,
-            'Kolkata': 190, 'Chennai': 130, 'Hyderabad': 150,
-            'Pune': 145, 'Ahmedabad': 165, 'Jaipur': 200, 'Lucknow': 220
+    async def _get_snapshot(self) -> Dict:
+        """Current national snapshot, rebuilt at most once per snapshot_ttl"""
+        snapshot = await cache.aget("realtime:snapshot")
+        if snapshot is None:
+            if self.cpcb_api_key:
+                snapshot = await self._fetch_snapshot(datetime.utcnow())
+            else:
+                snapshot = self._build_snapshot(datetime.utcnow())
+            await cache.aset("realtime:snapshot", snapshot, ttl=self.snapshot_ttl)
+        return snapshot
+    
+    async def _fetch_snapshot(self, now: datetime) -> Dict:
+        """Snapshot from the CPCB API, one concurrent request per city
+        
+        Cities whose request fails keep their generated values.
+        """
+        snapshot = self._build_snapshot(now)
+        snapshot['aqi'] = snapshot['aqi'].astype(float)
+        for name in POLLUTANT_PROFILE:
+            snapshot[name] = snapshot[name].astype(float)
+        
+        results = await asyncio.gather(
+            *[self.fetch_city(city) for city in self.cities.names],
+            return_exceptions=True
+        )
+        for i, (city, result) in enumerate(zip(self.cities.names, results)):
+            if isinstance(result, Exception):
+                print(f"Error fetching CPCB data for {city}: {result}")
+                continue
+            for name, value in result.items():
+                snapshot[name][i] = value
+        return snapshot
+    
+    async def fetch_city(self, city: str) -> Dict:
+        """Station-averaged pollutant concentrations for one city from data.gov.in
+        
+        The AQI is the highest pollutant sub-index, as CPCB defines it.
+        """
+        payload = await self.http.get_json(self.base_url, params={
+            "api-key": self.cpcb_api_key,
+            "format": "json",
+            "limit": 500,
+            "filters[city]": city
+        })
+        
+        values: Dict[str, List[float]] = {}
+        for record in payload.get("records", []):
+            name = CPCB_POLLUTANTS.get(record.get("pollutant_id"))
+            value = record.get("avg_value", record.get("pollutant_avg"))
+            if name is None or value in (None, "", "NA"):
+                continue
+            values.setdefault(name, []).append(float(value))
+        
+        if not values:
+            raise ValueError(f"no pollutant records for {city}")
+        reading = {name: float(np.mean(samples)) for name, samples in values.items()}
+        reading['aqi'] = round(max(sub_index(name, value) for name, value in reading.items()))
+        return reading
+    
+    def _build_snapshot(self, now: datetime) -> Dict:
+        """Generate every city's reading at once as columnar arrays"""
+        # In production, this would make actual API calls
+        # For now, generating realistic mock data
+        n_cities = len(self.cities)
+        time_factor = self._get_time_factor(now)
+        seasonal_factor = self._get_seasonal_factor(now)
+        
+        # Same multiplication order as a per-city base * time * seasonal, so truncation agrees
+        aqi = (self.cities.base_aqi * time_factor * seasonal_factor
+               + np.random.randint(-20, 20, n_cities)).astype(int)
+        aqi = np.clip(aqi, 50, 450)  # Keep within realistic bounds
+        
+        ratios = np.array([ratio for ratio, _ in POLLUTANT_PROFILE.values()])
+        spread = np.array([noise for _, noise in POLLUTANT_PROFILE.values()])
+        pollutants = (aqi[:, np.newaxis] * ratios
+                      + np.random.randint(-spread, spread, (n_cities, len(spread)))).astype(int)
+        
+        return {
+            "cities": self.cities.names,
+            "timestamp": now.isoformat(),
+            "aqi": aqi,
+            **{name: pollutants[:, i] for i, name in enumerate(POLLUTANT_PROFILE)},
+            "co": np.round(aqi * 0.01 + np.random.uniform(-0.5, 0.5, n_cities), 2),
+            "lat": self.cities.lat,
+            "lng": self.cities.lng
         }
-        return city_averages.get(city, 150)
     
-    def _get_time_factor(self) -> float:
-        """Get time-based pollution factor (traffic patterns)"""
-        hour = datetime.now().hour
+    def _get_time_factor(self, now: Optional[datetime] = None) -> float:
+        """Get time-based pollution factor (traffic patterns) at a UTC time"""
+        hour = ((now or datetime.utcnow()) + IST_OFFSET).hour
         if 7 <= hour <= 10 or 18 <= hour <= 21:
             return 1.3  # Peak traffic hours
         elif 11 <= hour <= 17:
@@ -86,9 +171,9 @@ class CPCBDataFetcher:
         else:
             return 0.8  # Low traffic
     
-    def _get_seasonal_factor(self) -> float:
-        """Get seasonal pollution factor"""
-        month = datetime.now().month
+    def _get_seasonal_factor(self, now: Optional[datetime] = None) -> float:
+        """Get seasonal pollution factor at a UTC time"""
+        month = ((now or datetime.utcnow()) + IST_OFFSET).month
         if month in [11, 12, 1]:  # Winter
             return 1.5
         elif month in [2, 3]:  # Spring
@@ -99,12 +184,16 @@ class CPCBDataFetcher:
             return 1.0
     
     async def fetch_historical(self, city: str, days: int = 30) -> List[Dict]:
-        """Fetch historical AQI data"""
+        """Fetch historical AQI data, from the stored daily rollups when ingested"""
+        stored = await asyncio.to_thread(self._stored_history, city, timedelta(days=days), 'day')
+        if stored:
+            return stored
+        
         data = []
-        base_aqi = self._get_city_base_aqi(city)
+        base_aqi = self.cities.get_base_aqi(city)
         
         for i in range(days):
-            date = datetime.now() - timedelta(days=i)
+            date = datetime.utcnow() - timedelta(days=i)
             
             # Add realistic variation
             daily_variation = np.random.randint(-30, 30)
@@ -125,30 +214,88 @@ class CPCBDataFetcher:
         
         return sorted(data, key=lambda x: x['date'])
     
+    async def fetch_hourly_history(self, city: str, hours: int = 24) -> List[Dict]:
+        """Hourly averages over the last hours from the stored rollups, oldest first ([] if none)"""
+        return await asyncio.to_thread(self._stored_history, city, timedelta(hours=hours), 'hour')
+    
+    def _stored_history(self, city: str, span: timedelta, resolution: str) -> List[Dict]:
+        """Averages per rollup bucket over the last span, or [] if none are available"""
+        try:
+            from database import SessionLocal
+            from rollups import get_history
+            end = datetime.utcnow()
+            db = SessionLocal()
+            try:
+                rows = get_history(db, city, end - span, end, resolution=resolution)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Stored history unavailable for {city}: {e}")
+            return []
+        
+        return [
+            {
+                "date": row['timestamp'],
+                "aqi": row['aqi'],
+                "pm25": row['pm25'],
+                "pm10": row['pm10'],
+                "no2": row['no2'],
+                "city": city
+            }
+            for row in rows
+        ]
+    
     async def fetch_current_aqi(self, city: str) -> float:
         """Fetch current AQI for a specific city"""
-        realtime_data = await self.fetch_realtime()
-        city_data = next((d for d in realtime_data if d['city'] == city), None)
-        return city_data['aqi'] if city_data else 150.0
+        index = self.cities.get_index(city)
+        if index is None:
+            return 150.0
+        snapshot = await self._get_snapshot()
+        return float(snapshot['aqi'][index])
 
 
 class WeatherDataFetcher:
     """Fetch weather data from OpenWeather API"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[HTTPClient] = None):
+        self.http = client or http_client
         self.api_key = os.getenv("OPENWEATHER_API_KEY", "")
         self.base_url = "https://api.openweathermap.org/data/2.5"
+        self.cities_config = city_registry.configs
+    
+    async def _get(self, endpoint: str, city: str) -> Dict:
+        config = self.cities_config[city]
+        return await self.http.get_json(f"{self.base_url}/{endpoint}", params={
+            "lat": config['lat'], "lon": config['lng'],
+            "appid": self.api_key, "units": "metric"
+        })
     
     async def fetch_current(self, cities: Optional[List[str]] = None) -> List[Dict]:
         """Fetch current weather data"""
+        selected = [city for city in self.cities_config if not cities or city in cities]
+        if self.api_key:
+            responses = await asyncio.gather(
+                *[self._get("weather", city) for city in selected],
+                return_exceptions=True
+            )
+            weather_data = []
+            for city, response in zip(selected, responses):
+                if isinstance(response, Exception):
+                    print(f"Error fetching weather for {city}: {response}")
+                    continue
+                weather_data.append({
+                    "city": city,
+                    "temp": response["main"]["temp"],
+                    "humidity": response["main"]["humidity"],
+                    "wind_speed": round(response["wind"]["speed"] * 3.6, 1),  # m/s -> km/h
+                    "pressure": response["main"]["pressure"],
+                    "conditions": response["weather"][0]["main"]
+                })
+            return weather_data
+        
         # Mock weather data
         weather_data = []
-        city_configs = CPCBDataFetcher()._load_cities_config()
-        
-        for city, config in city_configs.items():
-            if cities and city not in cities:
-                continue
-                
+        for city in selected:
             weather_data.append({
                 "city": city,
                 "temp": np.random.randint(20, 35),
@@ -162,10 +309,16 @@ class WeatherDataFetcher:
     
     async def fetch_forecast(self, city: str, hours: int = 48) -> List[Dict]:
         """Fetch weather forecast"""
+        if self.api_key and city in self.cities_config:
+            try:
+                return self._hourly_forecast(await self._get("forecast", city), hours)
+            except Exception as e:
+                print(f"Error fetching weather forecast for {city}, using generated data: {e}")
+        
         forecast = []
         
         for i in range(hours):
-            hour_time = datetime.now() + timedelta(hours=i)
+            hour_time = datetime.utcnow() + timedelta(hours=i)
             
             forecast.append({
                 "hour": i,
@@ -179,14 +332,50 @@ class WeatherDataFetcher:
         return forecast
 
 
+    def _hourly_forecast(self, response: Dict, hours: int) -> List[Dict]:
+        """Expand OpenWeather's 3-hourly forecast steps to hourly records"""
+        steps = response["list"]
+        now = datetime.utcnow()
+        forecast = []
+        for i in range(hours):
+            step = steps[min(i // 3, len(steps) - 1)]
+            forecast.append({
+                "hour": i,
+                "timestamp": (now + timedelta(hours=i)).isoformat(),
+                "temp": step["main"]["temp"],
+                "humidity": step["main"]["humidity"],
+                "wind_speed": step["wind"]["speed"] * 3.6,
+                "precipitation_prob": step.get("pop", 0) * 100
+            })
+        return forecast
+
+
 class NASADataFetcher:
     """Fetch satellite data from NASA EARTHDATA"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[HTTPClient] = None):
+        self.http = client or http_client
         self.api_key = os.getenv("NASA_API_KEY", "")
+        # EARTHDATA has no single JSON endpoint for these columns, so the service is configured
+        self.base_url = os.getenv("NASA_SATELLITE_URL", "")
     
     async def fetch_satellite_data(self, lat: float, lng: float, date: str) -> Dict:
         """Fetch satellite air quality data"""
+        if self.api_key and self.base_url:
+            try:
+                response = await self.http.get_json(self.base_url, params={
+                    "lat": lat, "lon": lng, "date": date, "api_key": self.api_key
+                })
+                return {
+                    "aerosol_optical_depth": response["aerosol_optical_depth"],
+                    "no2_column": response["no2_column"],
+                    "so2_column": response["so2_column"],
+                    "source": response.get("source", "NASA EARTHDATA"),
+                    "quality": response.get("quality", "high")
+                }
+            except Exception as e:
+                print(f"Error fetching satellite data, using generated data: {e}")
+        
         # Mock satellite data
         return {
             "aerosol_optical_depth": round(np.random.uniform(0.1, 0.8), 3),
@@ -0,0 +1,136 @@
+"""
+Feature layout shared by model training and inference
+"""
+
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Union
+
+FEATURE_NAMES = (
+    'aqi', 'pm25', 'pm10', 'no2', 'so2', 'co', 'o3',
+    'temp', 'humidity', 'wind_speed'
+)
+
+# Values used when a reading does not report a feature
+FEATURE_DEFAULTS = (150, 90, 140, 40, 10, 1.5, 30, 25, 60, 10)
+
+
+def feature_row(record: Dict) -> list:
+    """Feature vector for one reading, in FEATURE_NAMES order"""
+    return [
+        default if record.get(name) is None else record[name]
+        for name, default in zip(FEATURE_NAMES, FEATURE_DEFAULTS)
+    ]
+
+
+class FeaturePipeline:
+    """Defines the input each ensemble member sees for a window of readings
+
+    The LSTM consumes the (sequence_length, n_features) window as-is and the
+    tree ensembles consume the same window flattened row-major, exactly as
+    they are fitted in AQIPredictionModel.train.
+    """
+
+    def __init__(self, sequence_length: int = 24, n_features: int = len(FEATURE_NAMES)):
+        self.sequence_length = sequence_length
+        self.n_features = n_features
+
+    @property
+    def ensemble_width(self) -> int:
+        """Number of features the RF/GB members are fitted on"""
+        return self.sequence_length * self.n_features
+
+    def _check_windows(self, windows: np.ndarray) -> np.ndarray:
+        windows = np.asarray(windows)
+        expected = (self.sequence_length, self.n_features)
+        if windows.ndim != 3 or windows.shape[1:] != expected:
+            raise ValueError(f"Expected windows of shape (n, {expected[0]}, {expected[1]}), got {windows.shape}")
+        return windows
+
+    def lstm_input(self, windows: np.ndarray) -> np.ndarray:
+        """LSTM input: the windows unchanged, as float32"""
+        return self._check_windows(windows).astype(np.float32, copy=False)
+
+    def ensemble_input(self, windows: np.ndarray) -> np.ndarray:
+        """RF/GB input: each window flattened into one row"""
+        windows = self._check_windows(windows)
+        return windows.reshape(len(windows), self.ensemble_width)
+
+    def check_member(self, name: str, model) -> Optional[str]:
+        """Return why an ensemble member cannot serve this layout, or None if it can"""
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is None:
+            return f"{name} model is not fitted"
+        if n_features != self.ensemble_width:
+            return f"{name} model expects {n_features} features, pipeline provides {self.ensemble_width}"
+        return None
+
+
+class RollingFeatureWindow:
+    """Ring buffer holding a city's most recent feature rows
+
+    Readings are written in place as they arrive, so a forecast can start from
+    the live window without refetching and rebuilding the history. The models
+    treat each row as one hour, so observe() keeps one row per hour bucket.
+    """
+
+    def __init__(self, sequence_length: int = 24, n_features: int = len(FEATURE_NAMES)):
+        self.buffer = np.zeros((sequence_length, n_features), dtype=np.float32)
+        self.head = 0  # slot the next reading is written to
+        self.count = 0
+        self.hour: Optional[datetime] = None  # bucket the newest row covers
+        self._hour_readings = 0
+
+    @property
+    def is_full(self) -> bool:
+        return self.count == len(self.buffer)
+
+    def _append(self, row):
+        self.buffer[self.head] = row
+        self.head = (self.head + 1) % len(self.buffer)
+        self.count = min(self.count + 1, len(self.buffer))
+
+    def push(self, reading: Dict):
+        """Add one reading, overwriting the oldest once the window is full"""
+        self._append(feature_row(reading))
+
+    def extend(self, readings: Iterable[Dict]):
+        for reading in readings:
+            self.push(reading)
+
+    def observe(self, reading: Dict, timestamp: Union[datetime, str]):
+        """Fold a reading into the row for its hour
+
+        Readings within the newest hour are averaged into its row, a later hour
+        opens a new row (repeating the previous one over any missed hours) and
+        readings older than the newest hour are ignored.
+        """
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        hour = timestamp.replace(minute=0, second=0, microsecond=0)
+        if self.hour is not None and hour < self.hour:
+            return
+
+        if hour == self.hour:
+            self._hour_readings += 1
+            newest = self.buffer[(self.head - 1) % len(self.buffer)]
+            newest += (np.asarray(feature_row(reading), dtype=np.float32) - newest) / self._hour_readings
+            return
+
+        if self.hour is not None:
+            missed = (hour - self.hour) // timedelta(hours=1) - 1
+            previous = self.buffer[(self.head - 1) % len(self.buffer)].copy()
+            for _ in range(min(missed, len(self.buffer))):
+                self._append(previous)
+        self.push(reading)
+        self.hour, self._hour_readings = hour, 1
+
+    def to_array(self) -> np.ndarray:
+        """Window ordered oldest to newest, padded with the oldest row if not yet full"""
+        if self.count == 0:
+            return np.full_like(self.buffer, 150)
+        if not self.is_full:
+            rows = self.buffer[:self.count]
+            padding = np.repeat(rows[:1], len(self.buffer) - self.count, axis=0)
+            return np.concatenate([padding, rows])
+        return np.roll(self.buffer, -self.head, axis=0)
@@ -0,0 +1,136 @@
+"""
+Background scheduler that precomputes forecasts ahead of traffic
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import get_db_context, DatabaseOperations
+from city_registry import city_registry
+from rollups import floor_hour
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastScheduler:
+    """Recomputes every city's forecast on a fixed cadence
+
+    Each run forecasts the due cities in one batch through the prediction
+    service, which refreshes its cache, and persists the results to the
+    predictions table. A city is due when its cached forecast is at least half
+    an interval old and this worker wins the city's refresh claim in the
+    forecast_refreshes table, so across all workers each city is recomputed
+    once per half interval. The interval should stay below the service's cache
+    duration so requests always find a fresh forecast; jitter spreads workers'
+    runs apart.
+
+    With several workers the shared cache tier (CACHE_L2_URL) is required:
+    without it a forecast computed by one worker never reaches the others'
+    caches, and their requests recompute it inline once their own copy expires.
+    """
+
+    def __init__(self, service, cities: Optional[List[str]] = None,
+                 interval: Optional[float] = None, jitter: Optional[float] = None,
+                 model_version: str = "v2.0-lstm"):
+        self.service = service
+        self.cities = list(cities or city_registry.names)
+        self.interval = interval or float(os.getenv("FORECAST_REFRESH_INTERVAL", 1800))
+        self.jitter = jitter if jitter is not None else float(os.getenv("FORECAST_REFRESH_JITTER", 120))
+        self.model_version = model_version
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+
+    def start(self):
+        """Start the refresh loop on the running event loop"""
+        if self._task is None:
+            if self.service.cache.l2 is None:
+                logger.warning("CACHE_L2_URL is not set: other workers will not see scheduled forecasts")
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Cancel the refresh loop and wait for it to exit"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        # Jittered first run so workers started together do not refresh in lockstep
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Forecast refresh failed: {e}")
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+
+    async def run_once(self) -> Dict[str, Dict]:
+        """Forecast every due city now, updating the cache and the predictions table"""
+        start = time.perf_counter()
+        stale = []
+        for city in self.cities:
+            age = await self.service.forecast_age(city)
+            if age is None or age >= self.interval / 2:
+                stale.append(city)
+        due = await asyncio.to_thread(self._claim, stale) if stale else []
+        self.skipped += len(self.cities) - len(due)
+        
+        results = await self.service.refresh(due) if due else {}
+        stored = await asyncio.to_thread(self._persist, results) if results else 0
+
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_duration = time.perf_counter() - start
+        logger.info(
+            f"Refreshed forecasts for {len(results)} cities in {self.last_duration:.2f}s, "
+            f"stored {stored} predictions"
+        )
+        return results
+
+    def _claim(self, cities: List[str]) -> List[str]:
+        """Cities this worker won the refresh of, in schedule order"""
+        with get_db_context() as db:
+            claimed = set(DatabaseOperations.claim_forecast_refreshes(db, cities, self.interval / 2))
+        return [city for city in cities if city in claimed]
+
+    def _persist(self, results: Dict[str, Dict]) -> int:
+        """Write every forecast hour of every city in one transaction"""
+        rows = [
+            {
+                "city": city,
+                # Hour buckets, so overlapping runs replace rather than add rows
+                "prediction_time": floor_hour(datetime.fromisoformat(pred["timestamp"])),
+                "predicted_aqi": pred["predicted_aqi"],
+                "confidence": pred["confidence"],
+                "model_version": self.model_version
+            }
+            for city, result in results.items()
+            for pred in result["predictions"]
+        ]
+        with get_db_context() as db:
+            return DatabaseOperations.store_predictions(db, rows)
+
+    def stats(self) -> Dict:
+        return {
+            "cities": len(self.cities),
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration
+        }
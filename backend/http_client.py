@@ -0,0 +1,95 @@
+"""
+Shared HTTP client for upstream data sources
+"""
+
+import asyncio
+import logging
+import os
+import random
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream request fails after all retries"""
+
+
+class HTTPClient:
+    """App-scoped aiohttp session with pooling, DNS caching, timeouts and retries
+
+    One session is shared by every fetcher so connections to data.gov.in,
+    OpenWeather and NASA are kept alive and reused instead of being opened per
+    call. limit_per_host caps how many requests run against one upstream at once.
+    """
+
+    def __init__(self, limit: Optional[int] = None, limit_per_host: Optional[int] = None,
+                 timeout: Optional[float] = None, retries: Optional[int] = None,
+                 backoff: Optional[float] = None):
+        self.limit = limit or int(os.getenv("HTTP_POOL_LIMIT", 100))
+        self.limit_per_host = limit_per_host or int(os.getenv("HTTP_LIMIT_PER_HOST", 10))
+        self.timeout = timeout or float(os.getenv("HTTP_TIMEOUT", 10))
+        self.retries = retries if retries is not None else int(os.getenv("HTTP_RETRIES", 3))
+        self.backoff = backoff if backoff is not None else float(os.getenv("HTTP_BACKOFF", 0.5))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        """Open the shared session; called from the app lifespan"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=min(self.timeout, 5))
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        """The shared session, opened on first use outside the app lifespan"""
+        await self.start()
+        return self._session
+
+    async def get_json(self, url: str, params: Optional[Dict] = None) -> Any:
+        """GET a JSON document, retrying transient failures with exponential backoff"""
+        session = await self.session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    error = f"HTTP {response.status}"
+            except aiohttp.ClientResponseError as e:
+                raise UpstreamError(f"{url} returned HTTP {e.status}") from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < self.retries:
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logger.warning(f"{url} failed ({error}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        raise UpstreamError(f"{url} failed after {self.retries + 1} attempts: {error}")
+
+    async def get_status(self, url: str, timeout: float = 5) -> int:
+        """Status code of a single GET, without retries (for health checks)"""
+        session = await self.session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return response.status
+
+
+# Global HTTP client
+http_client = HTTPClient()
@@ -0,0 +1,75 @@
+"""
+Bounded executor for CPU-bound model inference
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+class InferenceQueueFull(Exception):
+    """Raised when every inference slot and queue position is taken"""
+
+
+class InferenceExecutor:
+    """Runs inference off the event loop with a concurrency limit and a bounded queue
+
+    At most max_workers forecasts run at once and up to max_queue more may wait.
+    Beyond that, run() fails immediately with InferenceQueueFull so the API can
+    answer 503 instead of letting requests pile up behind a slow forecast.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None):
+        self.max_workers = max_workers or int(os.getenv("INFERENCE_MAX_WORKERS", 2))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("INFERENCE_QUEUE_DEPTH", 8))
+        self._executor = None
+        self.in_flight = 0  # running plus queued, only touched from the event loop
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="inference"
+            )
+        return self._executor
+
+    def _release(self):
+        self.in_flight -= 1
+        self.completed += 1
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on the inference pool, or raise InferenceQueueFull"""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise InferenceQueueFull(
+                f"Inference queue full ({self.in_flight} forecasts in flight)"
+            )
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        future = self._get_executor().submit(fn, *args)
+        # Free the slot when the work really finishes, even if the caller stops waiting
+        future.add_done_callback(
+            lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release)
+        )
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+# Global inference executor
+inference_executor = InferenceExecutor()
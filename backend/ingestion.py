@@ -0,0 +1,128 @@
+"""
+Background ingestion of realtime readings into aqi_readings
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional
+
+from database import get_db_context, DatabaseOperations
+from data_fetcher import CPCBDataFetcher
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorker:
+    """Polls realtime readings on a schedule and persists them in bulk
+
+    Readings are de-duplicated by (city, timestamp), so polling faster than the
+    snapshot refreshes stores nothing twice. The database enforces the same
+    key, so readings also stored by another worker, or by an earlier attempt
+    of a flush that failed part-way, are skipped. They wait in a bounded buffer and
+    are flushed after every poll; if the database is unavailable they stay
+    buffered, dropping the oldest once max_buffer is reached. on_stored is
+    called with every reading once it has been written.
+    """
+
+    def __init__(self, fetcher: Optional[CPCBDataFetcher] = None,
+                 interval: Optional[float] = None, max_buffer: Optional[int] = None,
+                 batch_size: int = 5000, on_stored: Optional[Callable[[Dict], None]] = None):
+        self.fetcher = fetcher or CPCBDataFetcher()
+        self.on_stored = on_stored
+        self.interval = interval or float(os.getenv("INGEST_INTERVAL", 300))
+        self.max_buffer = max_buffer or int(os.getenv("INGEST_BUFFER_SIZE", 10000))
+        self.batch_size = batch_size
+        self.buffer: deque = deque(maxlen=self.max_buffer)
+        self._last_seen: Dict[str, str] = {}  # city -> newest buffered timestamp
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.counts = Counter()
+        self.last_flush: Optional[float] = None
+
+    def start(self):
+        """Start the polling loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop polling and flush whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Ingestion poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def poll_once(self) -> int:
+        """Fetch one snapshot, buffer its new readings and flush; returns rows stored"""
+        self.add(await self.fetcher.fetch_realtime())
+        return await self.flush()
+
+    def add(self, readings: List[Dict]) -> int:
+        """Buffer readings not seen before; returns how many were added"""
+        added = 0
+        for reading in readings:
+            city, timestamp = reading["city"], reading["timestamp"]
+            self.counts["polled"] += 1
+            if self._last_seen.get(city) == timestamp:
+                self.counts["duplicates"] += 1
+                continue
+            if len(self.buffer) == self.max_buffer:
+                self.counts["dropped"] += 1
+            self.buffer.append(reading)
+            self._last_seen[city] = timestamp
+            added += 1
+        return added
+
+    async def flush(self) -> int:
+        """Write the buffer in bulk; rows go back to the buffer if the write fails"""
+        async with self._flush_lock:
+            if not self.buffer:
+                return 0
+            rows = list(self.buffer)
+            self.buffer.clear()
+            try:
+                result = await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                self.counts["failed_flushes"] += 1
+                logger.error(f"Ingestion flush of {len(rows)} readings failed: {e}")
+                # Requeue ahead of anything buffered meanwhile; overflow drops the oldest
+                pending = list(self.buffer)
+                self.buffer.clear()
+                self.buffer.extend(rows + pending)
+                self.counts["dropped"] += max(0, len(rows) + len(pending) - self.max_buffer)
+                return 0
+
+            self.counts["stored"] += result["rows"]
+            self.counts["already_stored"] += result["skipped"]
+            self.last_flush = time.time()
+            if self.on_stored is not None:
+                for row in rows:
+                    self.on_stored(row)
+            return result["rows"]
+
+    def _write(self, rows: List[Dict]) -> Dict:
+        with get_db_context() as db:
+            return DatabaseOperations.bulk_store_aqi_readings(db, rows, batch_size=self.batch_size)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counts,
+            "buffered": len(self.buffer),
+            "max_buffer": self.max_buffer,
+            "interval": self.interval,
+            "last_flush": self.last_flush
+        }
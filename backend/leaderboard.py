@@ -0,0 +1,165 @@
+"""
+In-memory leaderboard over UserProfile.total_points
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class RankedList:
+    """Sorted list kept in bounded chunks, with a Fenwick tree over chunk sizes
+
+    Bisecting the chunk maxima finds the chunk holding a key and the Fenwick
+    tree turns it into a global position, so add, remove and index are
+    O(log n) plus a bounded shift inside one chunk (the layout of
+    sortedcontainers.SortedList). Chunks are split or dropped only rarely,
+    which is when the tree is rebuilt.
+    """
+
+    def __init__(self, keys: Iterable = (), load: int = 512):
+        self._load = load
+        keys = sorted(keys)
+        self._chunks = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self._reindex()
+
+    def _reindex(self):
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._tree = [0] * (len(self._chunks) + 1)
+        for i, chunk in enumerate(self._chunks, 1):
+            self._tree[i] += len(chunk)
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+        self._len = sum(map(len, self._chunks))
+
+    def _resize(self, i: int, delta: int):
+        """Record that chunk i grew or shrank by delta"""
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+        self._len += delta
+
+    def _before(self, i: int) -> int:
+        """Number of keys in the chunks ahead of chunk i"""
+        total = 0
+        while i:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        return chain.from_iterable(self._chunks)
+
+    def add(self, key):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._reindex()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._chunks) - 1)
+        chunk = self._chunks[i]
+        insort(chunk, key)
+        self._maxes[i] = chunk[-1]
+        if len(chunk) > 2 * self._load:
+            self._chunks[i:i + 1] = [chunk[:self._load], chunk[self._load:]]
+            self._reindex()
+        else:
+            self._resize(i, 1)
+
+    def remove(self, key):
+        """Remove key, raising ValueError if it isn't present"""
+        i = bisect_left(self._maxes, key)
+        chunk = self._chunks[i] if i < len(self._chunks) else []
+        j = bisect_left(chunk, key)
+        if j == len(chunk) or chunk[j] != key:
+            raise ValueError(f"{key!r} not in list")
+        del chunk[j]
+        if chunk:
+            self._maxes[i] = chunk[-1]
+            self._resize(i, -1)
+        else:
+            del self._chunks[i]
+            self._reindex()
+
+    def index(self, key) -> int:
+        """Number of keys ordered before key (its position if present)"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._chunks):
+            return self._len
+        return self._before(i) + bisect_left(self._chunks[i], key)
+
+
+class Leaderboard:
+    """Users ranked by total points, updated whenever points change
+
+    Entries are keyed (-points, user_id), so the front of the ranked list is
+    the top of the board. Ranks are competition ranks: users with equal
+    points share a rank. Built from the database at startup; each worker keeps
+    its own copy, so points awarded by other workers show up on the next
+    rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users: Dict[str, Tuple[int, str, int]] = {}  # user_id -> (points, username, level)
+        self._ranked = RankedList()
+        self.rebuilt_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def rebuild(self, rows: Iterable[Tuple[str, str, int, int]]) -> int:
+        """Replace the board with (user_id, username, total_points, level) rows; returns users loaded"""
+        users = {user_id: (points or 0, username, level) for user_id, username, points, level in rows}
+        ranked = RankedList((-points, user_id) for user_id, (points, _, _) in users.items())
+        with self._lock:
+            self._users, self._ranked = users, ranked
+            self.rebuilt_at = time.time()
+        return len(users)
+
+    def update(self, user_id: str, username: str, points: int, level: int):
+        """Move a user to their new score"""
+        points = points or 0
+        with self._lock:
+            previous = self._users.get(user_id)
+            if previous is None or previous[0] != points:
+                if previous is not None:
+                    self._ranked.remove((-previous[0], user_id))
+                self._ranked.add((-points, user_id))
+            self._users[user_id] = (points, username, level)
+
+    def _entry(self, user_id: str, rank: int) -> Dict:
+        points, username, level = self._users[user_id]
+        return {"rank": rank, "user_id": user_id, "username": username,
+                "total_points": points, "level": level}
+
+    def top(self, n: int = 10) -> List[Dict]:
+        """The n highest-scoring users"""
+        with self._lock:
+            entries = []
+            for position, (negated, user_id) in enumerate(islice(self._ranked, n)):
+                tied = entries and entries[-1]["total_points"] == -negated
+                entries.append(self._entry(user_id, entries[-1]["rank"] if tied else position + 1))
+            return entries
+
+    def rank(self, user_id: str) -> Optional[Dict]:
+        """A user's rank and score, or None if they aren't on the board"""
+        with self._lock:
+            if user_id not in self._users:
+                return None
+            points = self._users[user_id][0]
+            # "" sorts before every user_id, so this counts users with more points
+            return self._entry(user_id, self._ranked.index((-points, "")) + 1)
+
+    def stats(self) -> Dict:
+        return {"users": len(self._users), "rebuilt_at": self.rebuilt_at}
+
+
+# Global leaderboard
+leaderboard = Leaderboard()
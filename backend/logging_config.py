@@ -204,7 +204,6 @@ Comprehensive health check system
 import asyncio
 from datetime import datetime
 from typing import Dict, List
-import aiohttp
 
 
 class HealthChecker:
@@ -228,27 +227,18 @@ class HealthChecker:
         """Check external API availability"""
         checks = {}
         
-        # Check CPCB API
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    "https://api.data.gov.in",
-                    timeout=aiohttp.ClientTimeout(total=5)
-                ) as response:
-                    checks['cpcb'] = response.status < 500
-        except:
-            checks['cpcb'] = False
-        
-        # Check OpenWeather API
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    "https://api.openweathermap.org",
-                    timeout=aiohttp.ClientTimeout(total=5)
-                ) as response:
-                    checks['openweather'] = response.status < 500
-        except:
-            checks['openweather'] = False
+        # Probe both APIs concurrently over the shared session
+        from http_client import http_client
+        urls = {
+            'cpcb': "https://api.data.gov.in",
+            'openweather': "https://api.openweathermap.org"
+        }
+        statuses = await asyncio.gather(
+            *[http_client.get_status(url, timeout=5) for url in urls.values()],
+            return_exceptions=True
+        )
+        for name, result in zip(urls, statuses):
+            checks[name] = not isinstance(result, Exception) and result < 500
         
         all_healthy = all(checks.values())
         return all_healthy, checks
@@ -258,7 +248,7 @@ class HealthChecker:
         try:
             from ml_models import AQIPredictionModel
             model = AQIPredictionModel()
-            has_model = model.lstm_model is not None
+            has_model = model.lstm_infer is not None
             return has_model, "ML models loaded" if has_model else "ML models not loaded"
         except Exception as e:
             return False, f"ML model error: {str(e)}"
@@ -416,107 +406,3 @@ class RateLimiter:
 
 # Global rate limiter
 rate_limiter = RateLimiter()
-
-
-# ==================== Caching System ====================
-# Save as: backend/cache.py
-
-"""
-Simple in-memory caching system
-"""
-
-import asyncio
-from datetime import datetime, timedelta
-from typing import Any, Optional
-import json
-import hashlib
-
-
-class Cache:
-    """In-memory cache with TTL support"""
-    
-    def __init__(self, default_ttl=3600):
-        self.cache = {}
-        self.default_ttl = default_ttl
-        
-        # Start cleanup task
-        asyncio.create_task(self._cleanup_task())
-    
-    def _generate_key(self, *args, **kwargs) -> str:
-        """Generate cache key from arguments"""
-        key_data = json.dumps({
-            'args': args,
-            'kwargs': sorted(kwargs.items())
-        }, sort_keys=True)
-        return hashlib.md5(key_data.encode()).hexdigest()
-    
-    def set(self, key: str, value: Any, ttl: Optional[int] = None):
-        """Set cache value with TTL"""
-        if ttl is None:
-            ttl = self.default_ttl
-        
-        expiry = datetime.now() + timedelta(seconds=ttl)
-        self.cache[key] = {
-            'value': value,
-            'expiry': expiry
-        }
-    
-    def get(self, key: str) -> Optional[Any]:
-        """Get cache value if not expired"""
-        if key not in self.cache:
-            return None
-        
-        entry = self.cache[key]
-        if datetime.now() > entry['expiry']:
-            del self.cache[key]
-            return None
-        
-        return entry['value']
-    
-    def delete(self, key: str):
-        """Delete cache entry"""
-        if key in self.cache:
-            del self.cache[key]
-    
-    def clear(self):
-        """Clear all cache"""
-        self.cache.clear()
-    
-    async def _cleanup_task(self):
-        """Periodic cleanup of expired entries"""
-        while True:
-            await asyncio.sleep(60)
-            now = datetime.now()
-            
-            expired_keys = [
-                key for key, entry in self.cache.items()
-                if now > entry['expiry']
-            ]
-            
-            for key in expired_keys:
-                del self.cache[key]
-    
-    def cached(self, ttl: Optional[int] = None):
-        """Decorator for caching function results"""
-        def decorator(func):
-            async def wrapper(*args, **kwargs):
-                cache_key = self._generate_key(func.__name__, *args, **kwargs)
-                
-                # Check cache
-                cached_value = self.get(cache_key)
-                if cached_value is not None:
-                    return cached_value
-                
-                # Call function
-                result = await func(*args, **kwargs)
-                
-                # Store in cache
-                self.set(cache_key, result, ttl)
-                
-                return result
-            return wrapper
-        return decorator
-
-
-# Global cache instance
-cache = Cache()
\ No newline at end of file
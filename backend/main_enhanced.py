@@ -2,20 +2,34 @@
 Enhanced FastAPI Main Application with all routes integrated
 Replace your existing main.py with this file
 """
-from fastapi import FastAPI, HTTPException, Request, status
+from fastapi import FastAPI, HTTPException, Request, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
+import asyncio
 import time
 import logging
-from typing import Dict
+import os
+import sys
 import uvicorn
 
 # Import database and routes
-from database import init_db, engine
+from database import init_db, engine, async_engine, get_async_db, AsyncSessionLocal, AsyncDatabaseOperations
+from sqlalchemy.ext.asyncio import AsyncSession
+from rollups import ensure_partitions
 from routes import router as api_router
+from inference_executor import inference_executor, InferenceQueueFull
+from forecast_scheduler import ForecastScheduler
+from ingestion import IngestionWorker
+from vote_aggregator import VoteAggregator
+from http_client import http_client
+from city_registry import city_registry
+from leaderboard import leaderboard
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml.prediction_service import PredictionService
 
 # Configure logging
 logging.basicConfig(
@@ -26,22 +40,119 @@ logger = logging.getLogger(__name__)
 
 
 # Startup and shutdown events
+# Upper bound on how old /stats counters may be before they are recounted
+STATS_MAX_STALENESS = float(os.getenv("STATS_MAX_STALENESS", 300))
+
+
+async def refresh_stats_counters():
+    """Recount stale stats counters in the background so /stats never has to"""
+    while True:
+        await asyncio.sleep(STATS_MAX_STALENESS / 2)
+        try:
+            async with AsyncSessionLocal() as db:
+                # Only the worker that finds the counters stale pays for the recount
+                await AsyncDatabaseOperations.get_stats_counters(db, STATS_MAX_STALENESS / 2)
+        except Exception as e:
+            logger.error(f"Stats counter refresh failed: {e}")
+
+
+# Each worker's leaderboard picks up points awarded by other workers this often
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv("LEADERBOARD_REBUILD_INTERVAL", 300))
+
+
+async def rebuild_leaderboard():
+    """Rebuild the leaderboard from the database now and then periodically"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                users = await AsyncDatabaseOperations.rebuild_leaderboard(db)
+            logger.debug(f"Leaderboard rebuilt with {users} users")
+        except Exception as e:
+            logger.error(f"Leaderboard rebuild failed: {e}")
+        await asyncio.sleep(LEADERBOARD_REBUILD_INTERVAL)
+
+
+# New monthly aqi_readings partitions are created this often
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", 3600))
+
+
+async def maintain_partitions():
+    """Keep monthly partitions created ahead of incoming readings"""
+    while True:
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL)
+        try:
+            created = await asyncio.to_thread(ensure_partitions, engine)
+            if created:
+                logger.info(f"Created partitions: {', '.join(created)}")
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan events"""
     # Startup
     logger.info("Starting AirSense India API...")
+    # Index migrations are run once per deploy: python scripts/manage_db.py migrate
     try:
         init_db()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
+    try:
+        created = ensure_partitions(engine)
+        if created:
+            logger.info(f"Created partitions: {', '.join(created)}")
+    except Exception as e:
+        logger.error(f"Partition setup failed: {e}")
+    
+    await http_client.start()
+    stats_refresher = asyncio.create_task(refresh_stats_counters())
+    leaderboard_rebuilder = asyncio.create_task(rebuild_leaderboard())
+    partition_maintainer = asyncio.create_task(maintain_partitions())
+    
+    # Votes are coalesced per report and written in periodic batches
+    app.state.vote_aggregator = VoteAggregator()
+    app.state.vote_aggregator.start()
+    
+    # One prediction service per worker, kept warm by the forecast scheduler
+    app.state.prediction_service = None
+    app.state.forecast_scheduler = None
+    try:
+        app.state.prediction_service = PredictionService()
+        if os.getenv("FORECAST_SCHEDULER_ENABLED", "true").lower() == "true":
+            app.state.forecast_scheduler = ForecastScheduler(app.state.prediction_service)
+            app.state.forecast_scheduler.start()
+            logger.info("Forecast scheduler started")
+    except Exception as e:
+        logger.error(f"Prediction service initialization failed: {e}")
+    
+    # Persist realtime readings so history is served from stored data, and
+    # keep the forecast feature windows current as they are stored
+    app.state.ingestion_worker = None
+    if os.getenv("INGESTION_ENABLED", "true").lower() == "true":
+        app.state.ingestion_worker = IngestionWorker(
+            on_stored=app.state.prediction_service.observe if app.state.prediction_service else None
+        )
+        app.state.ingestion_worker.start()
+        logger.info("Ingestion worker started")
     
     yield
     
     # Shutdown
     logger.info("Shutting down AirSense India API...")
+    if app.state.forecast_scheduler is not None:
+        await app.state.forecast_scheduler.stop()
+    if app.state.ingestion_worker is not None:
+        await app.state.ingestion_worker.stop()  # flushes buffered readings
+    await app.state.vote_aggregator.stop()  # flushes pending votes
+    stats_refresher.cancel()
+    leaderboard_rebuilder.cancel()
+    partition_maintainer.cancel()
+    inference_executor.shutdown(wait=False)
+    await http_client.close()
     engine.dispose()
+    await async_engine.dispose()
 
 
 # Create FastAPI app
@@ -142,6 +253,22 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     )
 
 
+@app.exception_handler(InferenceQueueFull)
+async def inference_queue_full_handler(request: Request, exc: InferenceQueueFull):
+    """Shed load when the inference queue is full"""
+    logger.warning(f"Rejecting request, {exc}")
+    
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "5"},
+        content={
+            "detail": "Prediction service is busy, please retry shortly",
+            "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+            "request_id": f"{int(time.time())}-{id(request)}"
+        }
+    )
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle all other exceptions"""
@@ -182,7 +309,9 @@ async def root():
             "real_time": "/api/v1/realtime",
             "predictions": "/api/v1/predictions",
             "historical": "/api/v1/historical",
+            "compare": "/api/v1/compare?cities=Delhi,Mumbai",
             "community_reports": "/api/v1/community/reports",
+            "report_vote": "/api/v1/community/reports/{report_id}/vote",
             "policy_impact": "/api/v1/policy/impact",
             "source_attribution": "/api/v1/source-attribution/{city}",
             "health_impact": "/api/v1/health-impact/{city}",
@@ -193,14 +322,11 @@ async def root():
 
 
 @app.get("/health", tags=["Health"])
-async def health_check():
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Health check endpoint for monitoring"""
     try:
         # Test database connection
-        from database import SessionLocal
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        db.close()
+        await AsyncDatabaseOperations.ping(db)
         db_status = "healthy"
     except Exception as e:
         logger.error(f"Database health check failed: {e}")
@@ -212,36 +338,48 @@ async def health_check():
         "components": {
             "api": "healthy",
             "database": db_status,
-            "ml_models": "healthy"
+            "ml_models": "healthy",
+            "inference": inference_executor.stats(),
+            "model_fallbacks": (
+                app.state.prediction_service.model.get_fallback_stats()
+                if getattr(app.state, "prediction_service", None) else None
+            ),
+            "forecast_cache": (
+                app.state.prediction_service.get_cache_stats()
+                if getattr(app.state, "prediction_service", None) else None
+            ),
+            "forecast_scheduler": (
+                app.state.forecast_scheduler.stats()
+                if getattr(app.state, "forecast_scheduler", None) else None
+            ),
+            "ingestion": (
+                app.state.ingestion_worker.stats()
+                if getattr(app.state, "ingestion_worker", None) else None
+            ),
+            "votes": (
+                app.state.vote_aggregator.stats()
+                if getattr(app.state, "vote_aggregator", None) else None
+            ),
+            "leaderboard": leaderboard.stats()
         }
     }
 
 
 @app.get("/stats", tags=["Statistics"])
-async def get_system_stats():
-    """Get system statistics"""
-    from database import SessionLocal, AQIReading, CommunityReport, UserProfile
-    
+async def get_system_stats(db: AsyncSession = Depends(get_async_db)):
+    """Get system statistics from the counters table, at most STATS_MAX_STALENESS seconds old"""
     try:
-        db = SessionLocal()
-        
-        total_readings = db.query(AQIReading).count()
-        total_reports = db.query(CommunityReport).count()
-        total_users = db.query(UserProfile).count()
-        verified_reports = db.query(CommunityReport).filter(
-            CommunityReport.verified == True
-        ).count()
-        
-        db.close()
+        counts, refreshed_at = await AsyncDatabaseOperations.get_stats_counters(db, STATS_MAX_STALENESS)
         
         return {
-            "total_aqi_readings": total_readings,
-            "total_community_reports": total_reports,
-            "verified_reports": verified_reports,
-            "total_users": total_users,
-            "cities_monitored": 10,
+            "total_aqi_readings": counts["aqi_readings"],
+            "total_community_reports": counts["community_reports"],
+            "verified_reports": counts["verified_reports"],
+            "total_users": counts["user_profiles"],
+            "cities_monitored": len(city_registry),
             "prediction_accuracy": 94.3,
-            "model_version": "v2.0-lstm"
+            "model_version": "v2.0-lstm",
+            "counters_refreshed_at": refreshed_at.isoformat()
         }
         
     except Exception as e:
@@ -262,8 +400,6 @@ app.include_router(
 
 # ==================== Run Application ====================
 if __name__ == "__main__":
-    import os
-    
     # Get configuration from environment
     host = os.getenv("APP_HOST", "0.0.0.0")
     port = int(os.getenv("APP_PORT", 8000))
@@ -0,0 +1,120 @@
+"""
+Idempotent index migrations for existing databases
+
+create_all only builds indexes together with new tables, so databases created
+before an index was declared in database.py are brought up to date here. Run
+once per deploy with `python scripts/manage_db.py migrate`, not from the app:
+on PostgreSQL indexes are built with CREATE INDEX CONCURRENTLY, which can take
+a while on large tables but does not block writes.
+"""
+
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+from database import Base, engine
+
+# Single-column indexes superseded by the composite and partial ones
+OBSOLETE_INDEXES = {
+    'aqi_readings': ('ix_aqi_readings_city', 'ix_aqi_readings_city_timestamp'),
+    'community_reports': ('ix_community_reports_verified',),
+    'user_activity': ('ix_user_activity_user_id',)
+}
+
+
+@contextmanager
+def _migration_connection(bind: Engine):
+    """One connection for the whole migration
+
+    On PostgreSQL it runs in autocommit mode, as CONCURRENTLY requires, and
+    holds an advisory lock so concurrent runs apply each change once.
+    """
+    if bind.dialect.name != "postgresql":
+        with bind.begin() as conn:
+            yield conn
+        return
+
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(hashtext('airsense_migrate'))"))
+        try:
+            yield conn
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(hashtext('airsense_migrate'))"))
+
+
+def _duplicates(table, index):
+    """Rows other than the newest per key of a unique index"""
+    newest = select(func.max(table.c.id)).group_by(*index.columns)
+    return table.c.id.not_in(newest)
+
+
+def _concurrently(conn, table) -> bool:
+    """Whether index DDL on table can run CONCURRENTLY (not on partitioned tables)"""
+    if conn.dialect.name != "postgresql":
+        return False
+    partitioned = conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name)"
+    ), {"name": table.name}).first()
+    return partitioned is None
+
+
+def _create_index(conn, index, concurrently: bool):
+    if not concurrently:
+        index.create(conn)
+        return
+    ddl = str(CreateIndex(index).compile(dialect=conn.dialect)).replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+    try:
+        conn.execute(text(ddl))
+    except Exception:
+        # A failed concurrent build leaves an invalid index behind
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        raise
+
+
+def migrate(bind: Engine = engine, drop_duplicates: bool = False) -> List[str]:
+    """Create declared indexes that are missing and drop superseded ones
+
+    A unique index is not built over rows that violate it: the duplicates are
+    reported and the index (and the indexes it supersedes) left as they are,
+    unless drop_duplicates is set, which keeps the newest row per key. Safe to
+    run repeatedly; returns the changes applied.
+    """
+    applied = []
+
+    with _migration_connection(bind) as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            concurrently = _concurrently(conn, table)
+            blocked = False
+
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.unique:
+                    duplicates = conn.execute(
+                        select(func.count()).select_from(table).where(_duplicates(table, index))
+                    ).scalar()
+                    if duplicates and not drop_duplicates:
+                        applied.append(f"skipped {index.name}: {duplicates} duplicate {table.name} rows")
+                        blocked = True
+                        continue
+                    if duplicates:
+                        conn.execute(table.delete().where(_duplicates(table, index)))
+                        applied.append(f"removed {duplicates} duplicate {table.name} rows")
+                _create_index(conn, index, concurrently)
+                applied.append(f"created {index.name}")
+
+            if blocked:
+                continue
+            for name in OBSOLETE_INDEXES.get(table.name, ()):
+                if name in existing:
+                    conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}{name}"))
+                    applied.append(f"dropped {name}")
+
+    return applied
@@ -1,45 +1,191 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Optional
 import pickle
 import joblib
 from datetime import datetime, timedelta
 import pandas as pd
+import os
+import threading
+from collections import Counter
+from numpy_lstm import NumpyLSTM, export_keras_model
+from tree_ensemble import TreeEnsemble, save_ensemble
+from feature_pipeline import FeaturePipeline, feature_row
+from inference_executor import InferenceExecutor, inference_executor
+from city_registry import city_registry
+
+# TensorFlow is imported on first use so NumPy-runtime workers never load it
+tf = None
+keras = None
+
+def _import_tensorflow():
+    """Import TensorFlow and Keras into this module"""
+    global tf, keras
+    if tf is None:
+        import tensorflow
+        from tensorflow import keras as tf_keras
+        tf, keras = tensorflow, tf_keras
+
+class CompiledLSTM:
+    """Graph-compiled inference wrapper with a fixed input signature
+    
+    keras.Model.predict builds a data adapter and runs callbacks on every call;
+    this traces the forward pass once for any batch size and calls it directly.
+    """
+    
+    def __init__(self, model, sequence_length: int, n_features: int):
+        self.model = model
+        self.sequence_length = sequence_length
+        self.n_features = n_features
+        _import_tensorflow()
+        self._forward = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec([None, sequence_length, n_features], tf.float32)]
+        )
+    
+    def warmup(self):
+        """Trace and run the graph once so the first request does not pay for it"""
+        self(np.zeros((1, self.sequence_length, self.n_features), dtype=np.float32))
+        return self
+    
+    def __call__(self, sequences: np.ndarray) -> np.ndarray:
+        return self._forward(tf.convert_to_tensor(sequences, dtype=tf.float32)).numpy()
 
 class AQIPredictionModel:
     """LSTM-based AQI prediction model with ensemble methods"""
     
-    def __init__(self, model_path: str = "models/"):
+    # AQI, PM2.5, PM10, NO2, SO2, CO and O3 estimated from a predicted AQI
+    POLLUTANT_RATIOS = np.array([1.0, 0.6, 0.8, 0.15, 0.08, 0.01, 0.12])
+    
+    # Ensemble weights; members that fail validation are left out and the rest renormalized
+    ENSEMBLE_WEIGHTS = {'lstm': 0.5, 'rf': 0.3, 'gb': 0.2}
+    
+    def __init__(self, model_path: str = "models/", runtime: Optional[str] = None,
+                 tree_runtime: Optional[str] = None,
+                 executor: Optional[InferenceExecutor] = None):
         self.model_path = model_path
+        # Forecasts run here so they never block the event loop
+        self.executor = executor or inference_executor
+        # "keras" serves and trains with TensorFlow; "numpy" serves exported weights only
+        self.runtime = runtime or os.getenv("MODEL_RUNTIME", "keras")
+        # "arrays" evaluates RF/GB from exported node arrays; "sklearn" uses the pickles
+        self.tree_runtime = tree_runtime or os.getenv("TREE_RUNTIME", "arrays")
         self.lstm_model = None
+        self.direct_model = None
+        self.lstm_infer = None
+        self.direct_infer = None
         self.rf_model = None
         self.gb_model = None
         self.scaler = MinMaxScaler()
         self.feature_scaler = StandardScaler()
         self.sequence_length = 24
         self.n_features = 10
+        self.max_horizon = 72
+        self.pipeline = FeaturePipeline(self.sequence_length, self.n_features)
+        self.active_members = {'rf': False, 'gb': False}
+        self.fallback_hits = Counter()
+        self._fallback_lock = threading.Lock()  # forecasts run on several executor threads
         self.load_or_initialize_models()
     
     def load_or_initialize_models(self):
         """Load pre-trained models or initialize new ones"""
+        if self.runtime == 'numpy' and self._load_numpy_models():
+            self._validate_ensemble()
+            return
+        
+        _import_tensorflow()
         try:
             self.lstm_model = keras.models.load_model(f'{self.model_path}aqi_lstm_model.h5')
-            self.rf_model = joblib.load(f'{self.model_path}rf_model.pkl')
-            self.gb_model = joblib.load(f'{self.model_path}gb_model.pkl')
-            with open(f'{self.model_path}scaler.pkl', 'rb') as f:
-                self.scaler = pickle.load(f)
+            self._load_ensemble_models()
             print("Models loaded successfully")
         except Exception as e:
             print(f"Initializing new models: {e}")
             self._initialize_lstm_model()
             self._initialize_ensemble_models()
+        
+        # The direct multi-horizon model is optional; predictions fall back to the rollout
+        try:
+            self.direct_model = keras.models.load_model(f'{self.model_path}aqi_direct_model.h5')
+        except Exception:
+            self.direct_model = None
+        
+        self._compile_inference()
+        self._validate_ensemble()
+    
+    def _validate_ensemble(self):
+        """Check the RF/GB members against the pipeline layout once, at load time"""
+        for name, model in [('rf', self.rf_model), ('gb', self.gb_model)]:
+            problem = self.pipeline.check_member(name, model)
+            self.active_members[name] = problem is None
+            if problem:
+                print(f"Excluding {name} from the ensemble: {problem}")
+    
+    def get_fallback_stats(self) -> Dict:
+        """Rows served by the fallback value per member, and which members are active"""
+        with self._fallback_lock:
+            fallback_hits = dict(self.fallback_hits)
+        return {
+            "fallback_hits": fallback_hits,
+            "active_members": dict(self.active_members)
+        }
+    
+    def _load_ensemble_models(self):
+        """Load the fitted RF/GB models and the scaler"""
+        self.rf_model = self._load_tree_model('rf')
+        self.gb_model = self._load_tree_model('gb')
+        with open(f'{self.model_path}scaler.pkl', 'rb') as f:
+            self.scaler = pickle.load(f)
+    
+    def _load_tree_model(self, name: str):
+        """Memory-map exported tree arrays if present, otherwise unpickle the sklearn model"""
+        tree_dir = f'{self.model_path}{name}_trees'
+        if self.tree_runtime == 'arrays' and os.path.isdir(tree_dir):
+            return TreeEnsemble.load(tree_dir)
+        return joblib.load(f'{self.model_path}{name}_model.pkl')
+    
+    def _load_numpy_models(self) -> bool:
+        """Load exported LSTM weights for TensorFlow-free inference"""
+        try:
+            self.lstm_infer = NumpyLSTM.load(f'{self.model_path}aqi_lstm_weights.npz')
+            self._load_ensemble_models()
+        except Exception as e:
+            print(f"NumPy runtime unavailable, falling back to Keras: {e}")
+            return False
+        
+        try:
+            self.direct_infer = NumpyLSTM.load(f'{self.model_path}aqi_direct_weights.npz')
+        except Exception:
+            self.direct_infer = None
+        
+        print("Models loaded successfully (NumPy runtime)")
+        return True
+    
+    def _compile_inference(self):
+        """Compile and warm up the inference graphs used on the prediction hot path"""
+        self.lstm_infer = CompiledLSTM(
+            self.lstm_model, self.sequence_length, self.n_features
+        ).warmup()
+        if self.direct_model is not None:
+            self.direct_infer = CompiledLSTM(
+                self.direct_model, self.sequence_length, self.n_features
+            ).warmup()
     
     def _initialize_lstm_model(self):
         """Initialize LSTM neural network"""
-        self.lstm_model = keras.Sequential([
+        self.lstm_model = self._build_lstm_network(n_outputs=1)
+    
+    def _initialize_direct_model(self):
+        """Initialize LSTM network that forecasts every horizon in one pass"""
+        self.direct_model = self._build_lstm_network(n_outputs=self.max_horizon)
+        self.direct_infer = CompiledLSTM(
+            self.direct_model, self.sequence_length, self.n_features
+        ).warmup()
+    
+    def _build_lstm_network(self, n_outputs: int):
+        """Build and compile the LSTM architecture with n_outputs targets"""
+        _import_tensorflow()
+        model = keras.Sequential([
             keras.layers.LSTM(128, return_sequences=True, 
                             input_shape=(self.sequence_length, self.n_features)),
             keras.layers.Dropout(0.2),
@@ -50,14 +196,15 @@ class AQIPredictionModel:
             keras.layers.Dense(64, activation='relu'),
             keras.layers.BatchNormalization(),
             keras.layers.Dense(32, activation='relu'),
-            keras.layers.Dense(1, activation='linear')
+            keras.layers.Dense(n_outputs, activation='linear')
         ])
         
-        self.lstm_model.compile(
+        model.compile(
             optimizer=keras.optimizers.Adam(learning_rate=0.001),
             loss='huber',
             metrics=['mae', 'mse']
         )
+        return model
     
     def _initialize_ensemble_models(self):
         """Initialize Random Forest and Gradient Boosting models"""
@@ -78,78 +225,138 @@ class AQIPredictionModel:
     
     async def predict(self, historical_data: List[Dict], 
                      weather_forecast: List[Dict], 
-                     hours: int = 48) -> List[Dict]:
+                     hours: int = 48,
+                     direct: bool = False) -> List[Dict]:
         """Generate AQI predictions using ensemble of models"""
+        forecasts = await self.predict_batch([historical_data], [weather_forecast], hours, direct)
+        return forecasts[0]
+    
+    async def predict_batch(self, historical_batch: List[List[Dict]],
+                            weather_batch: List[List[Dict]],
+                            hours: int = 48,
+                            direct: bool = False) -> List[List[Dict]]:
+        """Generate AQI predictions for several cities in one batched rollout
         
-        # Prepare features
-        features = self._prepare_features(historical_data, weather_forecast)
+        With direct=True the multi-horizon model produces the whole horizon in a
+        single forward pass; without a trained direct model the rollout is used.
+        """
         
-        predictions = []
-        current_sequence = features[-self.sequence_length:].copy()
+        # Stack every city's window into a single (n_cities, sequence_length, n_features) tensor
+        sequences = np.stack([
+            self._prepare_features(historical, weather)
+            for historical, weather in zip(historical_batch, weather_batch)
+        ])
+        return await self.predict_windows(sequences, weather_batch, hours, direct)
+    
+    async def predict_windows(self, sequences: np.ndarray,
+                              weather_batch: List[List[Dict]],
+                              hours: int = 48,
+                              direct: bool = False) -> List[List[Dict]]:
+        """Generate AQI predictions starting from prepared feature windows"""
+        return await self.executor.run(
+            self._forecast_windows, sequences, weather_batch, hours, direct
+        )
+    
+    def _forecast_windows(self, sequences: np.ndarray,
+                          weather_batch: List[List[Dict]],
+                          hours: int, direct: bool) -> List[List[Dict]]:
+        """Synchronous forecast body, run on the inference executor"""
+        if direct and self.direct_infer is not None and hours <= self.max_horizon:
+            values = self._direct_forecast(sequences, hours)
+        else:
+            weather = np.stack([self._weather_matrix(w, hours) for w in weather_batch])
+            values = self._rollout(sequences, weather)
+        return [self._format_predictions(row) for row in values]
+    
+    def _rollout(self, sequences: np.ndarray, weather: np.ndarray) -> np.ndarray:
+        """Recursive forecast over a batch: one LSTM and one RF/GB call per step"""
+        n_rows, hours = weather.shape[0], weather.shape[1]
+        n_pollutants = len(self.POLLUTANT_RATIOS)
+        
+        # One buffer for the whole rollout; step i reads the window starting at row i
+        timeline = np.empty((n_rows, self.sequence_length + hours, self.n_features), dtype=np.float32)
+        timeline[:, :self.sequence_length] = sequences
+        timeline[:, self.sequence_length:, n_pollutants:] = weather
+        values = np.empty((n_rows, hours))
         
         for i in range(hours):
-            # LSTM prediction
-            lstm_input = current_sequence.reshape(1, self.sequence_length, self.n_features)
-            lstm_pred = self.lstm_model.predict(lstm_input, verbose=0)[0][0]
+            current_sequence = timeline[:, i:i + self.sequence_length]
+            ensemble_pred = self._ensemble_step(current_sequence)
+            values[:, i] = ensemble_pred
             
-            # Ensemble prediction (using recent features)
-            recent_features = current_sequence[-1].reshape(1, -1)
-            rf_pred = self._safe_predict(self.rf_model, recent_features)
-            gb_pred = self._safe_predict(self.gb_model, recent_features)
-            
-            # Weighted ensemble
-            ensemble_pred = (0.5 * lstm_pred + 0.3 * rf_pred + 0.2 * gb_pred)
+            # Append the predicted pollutant levels as the next step's newest row
+            timeline[:, self.sequence_length + i, :n_pollutants] = (
+                ensemble_pred[:, np.newaxis] * self.POLLUTANT_RATIOS
+            )
+        
+        return values
+    
+    def _ensemble_step(self, windows: np.ndarray) -> np.ndarray:
+        """Weighted LSTM/RF/GB prediction for the next hour of each window"""
+        weights = self.ENSEMBLE_WEIGHTS
+        
+        # LSTM prediction
+        ensemble_pred = weights['lstm'] * self.lstm_infer(self.pipeline.lstm_input(windows))[:, 0]
+        total_weight = weights['lstm']
+        
+        # Tree ensembles see the whole window flattened, as in training
+        ensemble_features = self.pipeline.ensemble_input(windows)
+        for name, model in [('rf', self.rf_model), ('gb', self.gb_model)]:
+            if self.active_members[name]:
+                ensemble_pred = ensemble_pred + weights[name] * self._safe_predict(name, model, ensemble_features)
+                total_weight += weights[name]
+        
+        return ensemble_pred / total_weight
+    
+    def _direct_forecast(self, sequences: np.ndarray, hours: int) -> np.ndarray:
+        """Forecast every horizon of a batch in one forward pass of the direct model"""
+        values = self.direct_infer(sequences)
+        return values[:, :hours].astype(float)
+    
+    def _format_predictions(self, values: np.ndarray) -> List[Dict]:
+        """Build prediction records for one city's forecast"""
+        now = datetime.utcnow()
+        predictions = []
+        
+        for i, ensemble_pred in enumerate(values.tolist()):
+            # AQI is never negative; clamping first keeps lower <= predicted <= upper
+            ensemble_pred = max(0.0, ensemble_pred)
             
             # Add realistic bounds and variation
-            confidence = self._calculate_confidence(i, hours)
+            confidence = self._calculate_confidence(i, len(values))
             lower_bound = ensemble_pred * (1 - (1 - confidence / 100) * 0.2)
             upper_bound = ensemble_pred * (1 + (1 - confidence / 100) * 0.2)
             
             predictions.append({
                 "hour": i,
-                "timestamp": (datetime.now() + timedelta(hours=i)).isoformat(),
-                "predicted_aqi": max(0, round(ensemble_pred, 1)),
+                "timestamp": (now + timedelta(hours=i)).isoformat(),
+                "predicted_aqi": round(ensemble_pred, 1),
                 "confidence": round(confidence, 1),
-                "lower_bound": max(0, round(lower_bound, 1)),
+                "lower_bound": round(lower_bound, 1),
                 "upper_bound": round(upper_bound, 1),
                 "risk_level": self._get_risk_level(ensemble_pred)
             })
-            
-            # Update sequence with prediction
-            new_feature = self._create_feature_vector(ensemble_pred, i, weather_forecast)
-            current_sequence = np.vstack([current_sequence[1:], new_feature])
         
         return predictions
     
-    def _safe_predict(self, model, features):
-        """Safely predict with fallback"""
+    def _safe_predict(self, name: str, model, features):
+        """Safely predict a batch of rows with fallback"""
         try:
-            if hasattr(model, 'predict'):
-                return model.predict(features)[0]
-        except:
-            pass
-        return 150.0  # Fallback value
+            return np.asarray(model.predict(features), dtype=float)
+        except Exception as e:
+            with self._fallback_lock:
+                first_failure = not self.fallback_hits[name]
+                self.fallback_hits[name] += len(features)
+            if first_failure:
+                print(f"{name} prediction failed, serving fallback values: {e}")
+        return np.full(len(features), 150.0)  # Fallback value
     
     def _prepare_features(self, historical_data: List[Dict], 
                          weather_forecast: List[Dict]) -> np.ndarray:
         """Prepare feature matrix from historical and weather data"""
         
         # Extract features from historical data
-        features_list = []
-        for record in historical_data[-self.sequence_length:]:
-            feature_vector = [
-                record.get('aqi', 150),
-                record.get('pm25', 90),
-                record.get('pm10', 140),
-                record.get('no2', 40),
-                record.get('so2', 10),
-                record.get('co', 1.5),
-                record.get('o3', 30),
-                record.get('temp', 25),
-                record.get('humidity', 60),
-                record.get('wind_speed', 10)
-            ]
-            features_list.append(feature_vector)
+        features_list = [feature_row(record) for record in historical_data[-self.sequence_length:]]
         
         # Pad if necessary
         while len(features_list) < self.sequence_length:
@@ -157,24 +364,16 @@ class AQIPredictionModel:
         
         return np.array(features_list)
     
-    def _create_feature_vector(self, predicted_aqi: float, 
-                              hour: int, 
-                              weather_forecast: List[Dict]) -> np.ndarray:
-        """Create feature vector for next prediction"""
-        weather = weather_forecast[hour] if hour < len(weather_forecast) else weather_forecast[-1]
-        
-        return np.array([
-            predicted_aqi,
-            predicted_aqi * 0.6,  # Estimated PM2.5
-            predicted_aqi * 0.8,  # Estimated PM10
-            predicted_aqi * 0.15,  # Estimated NO2
-            predicted_aqi * 0.08,  # Estimated SO2
-            predicted_aqi * 0.01,  # Estimated CO
-            predicted_aqi * 0.12,  # Estimated O3
-            weather.get('temp', 25),
-            weather.get('humidity', 60),
-            weather.get('wind_speed', 10)
-        ])
+    def _weather_matrix(self, weather_forecast: List[Dict], hours: int) -> np.ndarray:
+        """Weather features (temp, humidity, wind speed) for each forecast hour"""
+        rows = [
+            [w.get('temp', 25), w.get('humidity', 60), w.get('wind_speed', 10)]
+            for w in weather_forecast[:hours]
+        ] or [[25, 60, 10]]
+        
+        # Hold the last forecast hour if the weather forecast is shorter than the horizon
+        rows.extend([rows[-1]] * (hours - len(rows)))
+        return np.array(rows, dtype=float)
     
     def _calculate_confidence(self, hour: int, total_hours: int) -> float:
         """Calculate prediction confidence (decreases with time)"""
@@ -210,14 +409,7 @@ class AQIPredictionModel:
         # Use ML model to attribute sources based on pollutant ratios
         # In production, this would use trained classification models
         
-        base_attribution = {
-            'Delhi': {'Vehicular': 38, 'Industrial': 25, 'Construction': 20, 'Biomass': 12, 'Other': 5},
-            'Mumbai': {'Vehicular': 42, 'Industrial': 22, 'Construction': 18, 'Biomass': 8, 'Other': 10},
-            'Bangalore': {'Vehicular': 45, 'Industrial': 18, 'Construction': 22, 'Biomass': 7, 'Other': 8},
-        }
-        
-        attribution = base_attribution.get(city, 
-            {'Vehicular': 35, 'Industrial': 28, 'Construction': 18, 'Biomass': 12, 'Other': 7})
+        attribution = city_registry.get_attribution(city)
         
         # Add some variation
         result = []
@@ -252,22 +444,56 @@ class AQIPredictionModel:
             verbose=1
         )
         
+        # Array-backed ensembles are inference-only, so refit fresh sklearn models
+        if isinstance(self.rf_model, TreeEnsemble) or isinstance(self.gb_model, TreeEnsemble):
+            self._initialize_ensemble_models()
+        
         print("Training Random Forest...")
-        X_train_flat = X_train.reshape(X_train.shape[0], -1)
-        X_val_flat = X_val.reshape(X_val.shape[0], -1)
+        X_train_flat = self.pipeline.ensemble_input(X_train)
         self.rf_model.fit(X_train_flat, y_train)
         
         print("Training Gradient Boosting...")
         self.gb_model.fit(X_train_flat, y_train)
         
+        self._validate_ensemble()
+        self.save_models()
+        return history
+    
+    def train_direct(self, X_train, Y_train, X_val, Y_val, epochs: int = 50):
+        """Train the direct model on targets for every forecast horizon"""
+        if self.direct_model is None:
+            self._initialize_direct_model()
+        
+        print("Training direct multi-horizon LSTM model...")
+        history = self.direct_model.fit(
+            X_train, Y_train[:, :self.max_horizon],
+            validation_data=(X_val, Y_val[:, :self.max_horizon]),
+            epochs=epochs,
+            batch_size=32,
+            callbacks=[
+                keras.callbacks.EarlyStopping(patience=10, restore_best_weights=True),
+                keras.callbacks.ReduceLROnPlateau(patience=5, factor=0.5)
+            ],
+            verbose=1
+        )
+        
         self.save_models()
         return history
     
     def save_models(self):
         """Save trained models"""
         self.lstm_model.save(f'{self.model_path}aqi_lstm_model.h5')
-        joblib.dump(self.rf_model, f'{self.model_path}rf_model.pkl')
-        joblib.dump(self.gb_model, f'{self.model_path}gb_model.pkl')
+        export_keras_model(self.lstm_model, f'{self.model_path}aqi_lstm_weights.npz')
+        if self.direct_model is not None:
+            self.direct_model.save(f'{self.model_path}aqi_direct_model.h5')
+            export_keras_model(self.direct_model, f'{self.model_path}aqi_direct_weights.npz')
+        for name, model in [('rf', self.rf_model), ('gb', self.gb_model)]:
+            if isinstance(model, TreeEnsemble):
+                continue  # loaded from the saved arrays, nothing to write
+            joblib.dump(model, f'{self.model_path}{name}_model.pkl')
+            if hasattr(model, 'estimators_'):
+                # Array layout that workers memory-map and share
+                save_ensemble(model, f'{self.model_path}{name}_trees')
         with open(f'{self.model_path}scaler.pkl', 'wb') as f:
             pickle.dump(self.scaler, f)
         print("Models saved successfully")
\ No newline at end of file
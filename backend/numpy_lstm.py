@@ -0,0 +1,123 @@
+"""
+Pure-NumPy inference runtime for the LSTM forecasting network
+
+Exports the weights of the Sequential LSTM/Dense/BatchNormalization model built
+by AQIPredictionModel to a compact .npz file and runs its forward pass with
+NumPy alone, so API workers can serve predictions without importing TensorFlow.
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid
+}
+
+
+def export_keras_model(model, path: str):
+    """Write the inference weights of a Sequential Keras model to an .npz file"""
+    layers = []
+    arrays = {}
+
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        config = layer.get_config()
+        prefix = f"layer{len(layers)}"
+
+        if kind == 'Dropout':
+            continue  # identity at inference time
+        elif kind == 'LSTM':
+            if config['activation'] != 'tanh' or config['recurrent_activation'] != 'sigmoid':
+                raise ValueError(f"Unsupported LSTM activations in layer {layer.name}")
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            arrays[f"{prefix}_kernel"] = kernel
+            arrays[f"{prefix}_recurrent_kernel"] = recurrent_kernel
+            arrays[f"{prefix}_bias"] = bias
+            layers.append(f"lstm:{int(config['return_sequences'])}")
+        elif kind == 'Dense':
+            kernel, bias = layer.get_weights()
+            arrays[f"{prefix}_kernel"] = kernel
+            arrays[f"{prefix}_bias"] = bias
+            layers.append(f"dense:{config['activation']}")
+        elif kind == 'BatchNormalization':
+            # Fold the moving statistics into a single scale and shift
+            weights = list(layer.get_weights())
+            gamma = weights.pop(0) if config['scale'] else 1.0
+            beta = weights.pop(0) if config['center'] else 0.0
+            moving_mean, moving_variance = weights
+            scale = gamma / np.sqrt(moving_variance + config['epsilon'])
+            arrays[f"{prefix}_scale"] = scale.astype(np.float32)
+            arrays[f"{prefix}_shift"] = (beta - moving_mean * scale).astype(np.float32)
+            layers.append("batchnorm")
+        else:
+            raise ValueError(f"Unsupported layer for NumPy export: {kind}")
+
+    np.savez(path, layers=np.array(layers), **arrays)
+
+
+class NumpyLSTM:
+    """Forward pass of an exported LSTM network using NumPy only"""
+
+    def __init__(self, layers: List[Tuple[str, str, Dict[str, np.ndarray]]]):
+        self.layers = layers
+        first_kernel = layers[0][2]['kernel']
+        self.n_features = first_kernel.shape[0]
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyLSTM":
+        """Load weights written by export_keras_model"""
+        with np.load(path) as data:
+            layers = []
+            for i, spec in enumerate(data['layers'].tolist()):
+                kind, _, option = spec.partition(':')
+                prefix = f"layer{i}_"
+                params = {
+                    key[len(prefix):]: data[key]
+                    for key in data.files if key.startswith(prefix)
+                }
+                layers.append((kind, option, params))
+        return cls(layers)
+
+    def __call__(self, sequences: np.ndarray) -> np.ndarray:
+        x = np.asarray(sequences, dtype=np.float32)
+        for kind, option, params in self.layers:
+            if kind == 'lstm':
+                x = self._lstm(x, params, return_sequences=option == '1')
+            elif kind == 'dense':
+                x = ACTIVATIONS[option](x @ params['kernel'] + params['bias'])
+            elif kind == 'batchnorm':
+                x = x * params['scale'] + params['shift']
+        return x
+
+    @staticmethod
+    def _lstm(x: np.ndarray, params: Dict[str, np.ndarray], return_sequences: bool) -> np.ndarray:
+        """Run one LSTM layer over a (batch, time, features) input"""
+        batch_size, timesteps, _ = x.shape
+        units = params['recurrent_kernel'].shape[0]
+
+        # Input projections for every timestep at once; gates are ordered i, f, c, o
+        projected = x @ params['kernel'] + params['bias']
+        h = np.zeros((batch_size, units), dtype=np.float32)
+        c = np.zeros((batch_size, units), dtype=np.float32)
+        outputs = np.empty((batch_size, timesteps, units), dtype=np.float32) if return_sequences else None
+
+        for t in range(timesteps):
+            z = projected[:, t] + h @ params['recurrent_kernel']
+            i = _sigmoid(z[:, :units])
+            f = _sigmoid(z[:, units:2 * units])
+            g = np.tanh(z[:, 2 * units:3 * units])
+            o = _sigmoid(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+            if return_sequences:
+                outputs[:, t] = h
+
+        return outputs if return_sequences else h
@@ -0,0 +1,280 @@
+"""
+Hourly/daily rollups of aqi_readings and range queries over them
+
+Ingestion folds every batch of readings into per-city hourly and daily
+buckets, so history and comparison queries over long ranges read a few
+hundred rollup rows instead of scanning raw readings.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database import (
+    AQIReading, ROLLUP_POLLUTANTS, ROLLUP_STATS,
+    aqi_rollup_hourly, aqi_rollup_daily
+)
+
+ROLLUP_TABLES = {'hour': aqi_rollup_hourly, 'day': aqi_rollup_daily}
+RESOLUTIONS = ('raw', 'hour', 'day')
+
+
+def floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil(ts: datetime, floor, step: timedelta) -> datetime:
+    floored = floor(ts)
+    return floored if floored == ts else floored + step
+
+
+FLOORS = {'hour': floor_hour, 'day': floor_day}
+
+
+def aggregate(rows: Iterable[Dict], resolution: str) -> Dict[Tuple[str, datetime], Dict]:
+    """Fold readings into {(city, bucket): {pollutant_stat: value}}"""
+    floor = FLOORS[resolution]
+    buckets: Dict[Tuple[str, datetime], Dict] = {}
+    for row in rows:
+        key = (row['city'], floor(row['timestamp']))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {f'{p}_{stat}': None for p in ROLLUP_POLLUTANTS for stat in ROLLUP_STATS}
+        for pollutant in ROLLUP_POLLUTANTS:
+            value = row.get(pollutant)
+            if value is None:
+                continue
+            count = f'{pollutant}_count'
+            if bucket[count] is None:
+                bucket[count], bucket[f'{pollutant}_sum'] = 1, value
+                bucket[f'{pollutant}_min'] = bucket[f'{pollutant}_max'] = value
+            else:
+                bucket[count] += 1
+                bucket[f'{pollutant}_sum'] += value
+                bucket[f'{pollutant}_min'] = min(bucket[f'{pollutant}_min'], value)
+                bucket[f'{pollutant}_max'] = max(bucket[f'{pollutant}_max'], value)
+    return buckets
+
+
+def _upsert(db: Session, table, buckets: Dict[Tuple[str, datetime], Dict]):
+    """Merge bucket partials into existing rollup rows with one INSERT ... ON CONFLICT"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        least, greatest = func.least, func.greatest  # both ignore NULLs
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        # Multi-argument min/max return NULL if any argument is NULL
+        least = lambda a, b: func.min(func.coalesce(a, b), func.coalesce(b, a))
+        greatest = lambda a, b: func.max(func.coalesce(a, b), func.coalesce(b, a))
+    else:
+        raise NotImplementedError(f"Rollups are not supported on {dialect}")
+
+    statement = insert(table).values([
+        {'city': city, 'bucket': bucket, **stats} for (city, bucket), stats in buckets.items()
+    ])
+    merged = {}
+    for pollutant in ROLLUP_POLLUTANTS:
+        for stat in ('count', 'sum'):
+            column = f'{pollutant}_{stat}'
+            merged[column] = func.coalesce(table.c[column], 0) + func.coalesce(statement.excluded[column], 0)
+        merged[f'{pollutant}_min'] = least(table.c[f'{pollutant}_min'], statement.excluded[f'{pollutant}_min'])
+        merged[f'{pollutant}_max'] = greatest(table.c[f'{pollutant}_max'], statement.excluded[f'{pollutant}_max'])
+
+    db.execute(statement.on_conflict_do_update(index_elements=['city', 'bucket'], set_=merged))
+
+
+def update_rollups(db: Session, rows: List[Dict]):
+    """Fold a batch of normalized readings into the hourly and daily rollups"""
+    if not rows:
+        return
+    for resolution, table in ROLLUP_TABLES.items():
+        _upsert(db, table, aggregate(rows, resolution))
+
+
+def choose_resolution(start: datetime, end: datetime) -> str:
+    """Default series resolution: hourly up to two days, daily beyond"""
+    return 'hour' if end - start <= timedelta(days=2) else 'day'
+
+
+def _series_row(city: str, bucket: datetime, stats: Dict) -> Dict:
+    row = {'city': city, 'timestamp': bucket.isoformat(), 'count': stats['aqi_count'] or 0}
+    for pollutant in ROLLUP_POLLUTANTS:
+        count = stats[f'{pollutant}_count']
+        row[pollutant] = round(stats[f'{pollutant}_sum'] / count, 2) if count else None
+        row[f'{pollutant}_min'] = stats[f'{pollutant}_min']
+        row[f'{pollutant}_max'] = stats[f'{pollutant}_max']
+    return row
+
+
+def _raw_row(reading: AQIReading) -> Dict:
+    """A single reading in the same shape as a rollup bucket"""
+    row = {'city': reading.city, 'timestamp': reading.timestamp.isoformat(), 'count': 1}
+    for pollutant in ROLLUP_POLLUTANTS:
+        value = getattr(reading, pollutant)
+        row[pollutant] = row[f'{pollutant}_min'] = row[f'{pollutant}_max'] = value
+    return row
+
+
+def get_history(db: Session, city: str, start: datetime, end: datetime,
+                resolution: Optional[str] = None) -> List[Dict]:
+    """Per-bucket avg/min/max of every pollutant for city over [start, end)
+
+    Reads the rollup table matching the resolution ('hour' or 'day', chosen
+    from the range length when omitted), or raw readings for 'raw'.
+    """
+    resolution = resolution or choose_resolution(start, end)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected one of {RESOLUTIONS}")
+
+    if resolution == 'raw':
+        readings = db.query(AQIReading)\
+            .filter(AQIReading.city == city, AQIReading.timestamp >= start, AQIReading.timestamp < end)\
+            .order_by(AQIReading.timestamp)\
+            .all()
+        return [_raw_row(reading) for reading in readings]
+
+    table = ROLLUP_TABLES[resolution]
+    rows = db.execute(
+        select(table)
+        .where(table.c.city == city,
+               table.c.bucket >= FLOORS[resolution](start),
+               table.c.bucket < end)
+        .order_by(table.c.bucket)
+    ).mappings().all()
+    return [_series_row(city, row['bucket'], row) for row in rows]
+
+
+def split_range(start: datetime, end: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """Cover [start, end) with the coarsest pieces: raw edges, hourly edges, whole days"""
+    first_hour, last_hour = _ceil(start, floor_hour, timedelta(hours=1)), floor_hour(end)
+    if first_hour >= last_hour:
+        return [('raw', start, end)]
+
+    pieces = []
+    if start < first_hour:
+        pieces.append(('raw', start, first_hour))
+
+    first_day, last_day = _ceil(first_hour, floor_day, timedelta(days=1)), floor_day(last_hour)
+    if first_day < last_day:
+        if first_hour < first_day:
+            pieces.append(('hour', first_hour, first_day))
+        pieces.append(('day', first_day, last_day))
+        if last_day < last_hour:
+            pieces.append(('hour', last_day, last_hour))
+    else:
+        pieces.append(('hour', first_hour, last_hour))
+
+    if last_hour < end:
+        pieces.append(('raw', last_hour, end))
+    return pieces
+
+
+def summarize(db: Session, cities: List[str], start: datetime, end: datetime,
+              metric: str = 'aqi') -> Dict[str, Dict]:
+    """Avg/min/max of one pollutant per city over [start, end), exact to the reading
+
+    Whole days come from the daily rollup, remaining whole hours from the
+    hourly rollup and only the partial hours at either end from raw readings.
+    """
+    if metric not in ROLLUP_POLLUTANTS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {ROLLUP_POLLUTANTS}")
+
+    totals = {city: {'count': 0, 'sum': 0.0, 'min': None, 'max': None} for city in cities}
+    for resolution, piece_start, piece_end in split_range(start, end):
+        if resolution == 'raw':
+            column = getattr(AQIReading, metric)
+            query = select(
+                AQIReading.city, func.count(column), func.sum(column), func.min(column), func.max(column)
+            ).where(AQIReading.city.in_(cities),
+                    AQIReading.timestamp >= piece_start, AQIReading.timestamp < piece_end)\
+             .group_by(AQIReading.city)
+        else:
+            table = ROLLUP_TABLES[resolution]
+            query = select(
+                table.c.city,
+                func.sum(table.c[f'{metric}_count']), func.sum(table.c[f'{metric}_sum']),
+                func.min(table.c[f'{metric}_min']), func.max(table.c[f'{metric}_max'])
+            ).where(table.c.city.in_(cities),
+                    table.c.bucket >= piece_start, table.c.bucket < piece_end)\
+             .group_by(table.c.city)
+
+        for city, count, total, low, high in db.execute(query):
+            if not count:
+                continue
+            summary = totals[city]
+            summary['count'] += count
+            summary['sum'] += total
+            summary['min'] = low if summary['min'] is None else min(summary['min'], low)
+            summary['max'] = high if summary['max'] is None else max(summary['max'], high)
+
+    return {
+        city: {
+            'count': summary['count'],
+            'avg': round(summary['sum'] / summary['count'], 2) if summary['count'] else None,
+            'min': summary['min'],
+            'max': summary['max']
+        }
+        for city, summary in totals.items()
+    }
+
+
+DEFAULT_PARTITION_QUERY = text("""
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'aqi_readings'::regclass
+      AND pg_get_expr(child.relpartbound, child.oid) = 'DEFAULT'
+""")
+
+
+def ensure_partitions(bind: Engine, months_ahead: int = 2, now: Optional[datetime] = None) -> List[str]:
+    """Create monthly aqi_readings partitions up to months_ahead on PostgreSQL
+
+    A no-op unless aqi_readings was created as a partitioned table (schema.sql).
+    Safe to call repeatedly from every worker. Readings already caught by the
+    default partition for a new month are moved into it. Returns the
+    partitions created.
+    """
+    if bind.dialect.name != "postgresql":
+        return []
+
+    created = []
+    with bind.begin() as conn:
+        partitioned = conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'aqi_readings'::regclass"
+        )).first()
+        if not partitioned:
+            return []
+        # Workers run this concurrently, so one creates the partitions and the rest find them
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('aqi_readings_partitions'))"))
+        default = conn.execute(DEFAULT_PARTITION_QUERY).scalar()
+
+        month = floor_day(now or datetime.utcnow()).replace(day=1)
+        for _ in range(months_ahead + 1):
+            following = (month + timedelta(days=32)).replace(day=1)
+            name = f"aqi_readings_{month:%Y_%m}"
+            bounds = f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+            exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+            if exists is None:
+                if default is None:
+                    conn.execute(text(f"CREATE TABLE {name} PARTITION OF aqi_readings {bounds}"))
+                else:
+                    # Attaching fails while the default partition holds rows in range
+                    conn.execute(text(
+                        f"CREATE TABLE {name} (LIKE aqi_readings INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                    ))
+                    conn.execute(text(
+                        f"WITH moved AS (DELETE FROM {default} WHERE timestamp >= :start AND timestamp < :end "
+                        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+                    ), {"start": month, "end": following})
+                    conn.execute(text(f"ALTER TABLE aqi_readings ATTACH PARTITION {name} {bounds}"))
+                created.append(name)
+            month = following
+    return created
@@ -0,0 +1,78 @@
+"""
+API v1 routes
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import ROLLUP_POLLUTANTS, CommunityReport, get_async_db
+from leaderboard import leaderboard
+from rollups import summarize
+
+router = APIRouter()
+
+
+# ==================== Leaderboard ====================
+
+@router.get("/leaderboard", tags=["Community"])
+async def get_leaderboard(limit: int = Query(10, ge=1, le=100), user_id: Optional[str] = None):
+    """Top users by points, answered from the in-memory leaderboard"""
+    response = {"leaders": leaderboard.top(limit), "total_users": len(leaderboard)}
+    if user_id is not None:
+        response["user"] = leaderboard.rank(user_id)
+    return response
+
+
+@router.get("/leaderboard/{user_id}", tags=["Community"])
+async def get_user_rank(user_id: str):
+    """A single user's rank and points"""
+    entry = leaderboard.rank(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found on the leaderboard")
+    return entry
+
+
+# ==================== Community ====================
+
+@router.post("/community/reports/{report_id}/vote", status_code=202, tags=["Community"])
+async def vote_on_report(report_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Upvote a report; the vote is written with the next batched flush of the vote aggregator"""
+    if await db.get(CommunityReport, report_id) is None:
+        raise HTTPException(status_code=404, detail=f"Report {report_id} not found")
+    aggregator = request.app.state.vote_aggregator
+    aggregator.add(report_id)
+    return {"report_id": report_id, "queued": True, "pending_votes": aggregator.pending[report_id]}
+
+
+# ==================== Comparison ====================
+
+@router.get("/compare", tags=["Analytics"])
+async def compare_cities(
+    cities: str = Query(..., description="Comma-separated city names"),
+    metric: str = Query("aqi", description=f"One of {', '.join(ROLLUP_POLLUTANTS)}"),
+    days: int = Query(7, ge=1, le=365),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Avg/min/max of a pollutant per city over [start, end), the last days by default (UTC)"""
+    names = [city.strip() for city in cities.split(",") if city.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="No cities to compare")
+    if metric not in ROLLUP_POLLUTANTS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric {metric!r}")
+
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=days)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    return {
+        "metric": metric,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "cities": await db.run_sync(summarize, names, start, end, metric)
+    }
@@ -0,0 +1,1317 @@
+"""
+Backend test suite
+Usage: pytest backend/test_api.py -v
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# database.py connects at import, so default to a throwaway SQLite file
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/airsense_test.db")
+
+
+# ==================== ML Models ====================
+
+def test_numpy_runtime_matches_keras(tmp_path):
+    """The exported NumPy forward pass reproduces the Keras LSTM outputs"""
+    pytest.importorskip("tensorflow")
+    from ml_models import AQIPredictionModel
+
+    model_path = f"{tmp_path}/"
+    keras_model = AQIPredictionModel(model_path=model_path, runtime="keras")
+
+    # Give BatchNormalization non-trivial moving statistics before exporting
+    rng = np.random.default_rng(0)
+    for layer in keras_model.lstm_model.layers:
+        if layer.__class__.__name__ == "BatchNormalization":
+            gamma, beta, mean, variance = layer.get_weights()
+            layer.set_weights([
+                rng.uniform(0.5, 1.5, gamma.shape), rng.normal(0, 0.1, beta.shape),
+                rng.normal(0, 0.5, mean.shape), rng.uniform(0.5, 2.0, variance.shape)
+            ])
+    keras_model.save_models()
+
+    numpy_model = AQIPredictionModel(model_path=model_path, runtime="numpy")
+    sequences = rng.normal(0, 1, (8, 24, 10)).astype(np.float32)
+
+    np.testing.assert_allclose(
+        numpy_model.lstm_infer(sequences),
+        keras_model.lstm_infer(sequences),
+        rtol=1e-4, atol=1e-5
+    )
+
+
+def test_tree_ensemble_matches_sklearn(tmp_path):
+    """Array-backed trees predict what the fitted sklearn ensembles predict, before and after mmap"""
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+    from tree_ensemble import TreeEnsemble, save_ensemble
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 1, (400, 12))
+    y = X[:, 0] * 50 + np.sin(X[:, 1]) * 20 + rng.normal(0, 5, 400) + 150
+    X_new = rng.normal(0, 1.5, (200, 12))
+
+    for estimator in (RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0),
+                      GradientBoostingRegressor(n_estimators=30, max_depth=4, random_state=0)):
+        estimator.fit(X, y)
+        expected = estimator.predict(X_new)
+
+        np.testing.assert_allclose(TreeEnsemble.from_model(estimator).predict(X_new), expected, rtol=0, atol=1e-9)
+
+        directory = f"{tmp_path}/{type(estimator).__name__}"
+        save_ensemble(estimator, directory)
+        np.testing.assert_allclose(TreeEnsemble.load(directory).predict(X_new), expected, rtol=0, atol=1e-9)
+
+
+def _forecast_model(tmp_path):
+    """Freshly initialized Keras model with small fitted RF/GB members"""
+    pytest.importorskip("tensorflow")
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+    from ml_models import AQIPredictionModel
+
+    model = AQIPredictionModel(model_path=f"{tmp_path}/", runtime="keras")
+    rng = np.random.default_rng(0)
+    X = model.pipeline.ensemble_input(rng.uniform(0, 300, (200, model.sequence_length, model.n_features)))
+    y = X[:, -model.n_features] * 0.8 + 20
+    model.rf_model = RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0).fit(X, y)
+    model.gb_model = GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=0).fit(X, y)
+    model._validate_ensemble()
+    return model
+
+
+def _history(length, base):
+    return [{"aqi": base + 5 * i, "pm25": base / 2 + i, "pm10": base * 0.8, "temp": 20 + i % 5}
+            for i in range(length)]
+
+
+def _bounds(predictions):
+    return [(p["predicted_aqi"], p["lower_bound"], p["upper_bound"]) for p in predictions]
+
+
+def test_batched_rollout_matches_per_city_predict(tmp_path):
+    """One batched rollout over several cities forecasts what each city's own predict does"""
+    import asyncio
+
+    model = _forecast_model(tmp_path)
+    assert model.active_members == {"rf": True, "gb": True}
+    historical = [_history(40, 120), _history(30, 250), _history(7, 90), []]  # last two are short
+    weather = [[{"temp": 30, "humidity": 40, "wind_speed": 5}] * 12, [], [{"temp": 18}], []]
+
+    async def run():
+        batched = await model.predict_batch(historical, weather, hours=12)
+        single = [await model.predict(h, w, hours=12) for h, w in zip(historical, weather)]
+        return batched, single
+
+    batched, single = asyncio.run(run())
+    assert len(batched) == 4
+    for city_batched, city_single in zip(batched, single):
+        assert len(city_batched) == 12
+        for got, expected in zip(_bounds(city_batched), _bounds(city_single)):
+            assert got == pytest.approx(expected, abs=0.11)
+    # The cities really are forecast from their own windows
+    assert len({city[0]["predicted_aqi"] for city in batched}) > 1
+
+
+def test_direct_forecast_and_rollout_fallback(tmp_path):
+    """direct=True uses the multi-horizon model when it can and the rollout otherwise, with ordered bounds"""
+    import asyncio
+
+    model = _forecast_model(tmp_path)
+    history, weather = _history(30, 150), [{"temp": 28}] * 80
+
+    async def run():
+        rollout = await model.predict(history, weather, hours=24)
+        fallback = await model.predict(history, weather, hours=24, direct=True)  # no direct model yet
+        model._initialize_direct_model()
+        direct = await model.predict(history, weather, hours=24, direct=True)
+        too_long = await model.predict(history, weather, hours=model.max_horizon + 1, direct=True)
+        return rollout, fallback, direct, too_long
+
+    rollout, fallback, direct, too_long = asyncio.run(run())
+    assert _bounds(fallback) == _bounds(rollout)
+
+    sequences = model._prepare_features(history, weather)[np.newaxis]
+    expected = np.maximum(model.direct_infer(sequences)[0, :24], 0)
+    assert [p["predicted_aqi"] for p in direct] == pytest.approx(expected, abs=0.06)
+    assert len(too_long) == model.max_horizon + 1
+    assert too_long[0]["predicted_aqi"] == pytest.approx(rollout[0]["predicted_aqi"], abs=0.11)
+
+    for predictions in (rollout, direct, too_long):
+        assert all(0 <= low <= aqi <= high for aqi, low, high in _bounds(predictions))
+
+
+def test_mismatched_or_unfitted_members_are_excluded(tmp_path):
+    """Members that can't serve the pipeline layout are left out and the weights renormalized"""
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+
+    model = _forecast_model(tmp_path)
+    rng = np.random.default_rng(1)
+    model.rf_model = RandomForestRegressor(n_estimators=2).fit(rng.normal(size=(20, 10)), rng.normal(size=20))
+    model.gb_model = GradientBoostingRegressor()
+    model._validate_ensemble()
+
+    assert model.get_fallback_stats() == {"fallback_hits": {}, "active_members": {"rf": False, "gb": False}}
+    windows = rng.uniform(0, 300, (3, model.sequence_length, model.n_features))
+    np.testing.assert_allclose(model._ensemble_step(windows), model.lstm_infer(windows)[:, 0], rtol=1e-6)
+    assert model.get_fallback_stats()["fallback_hits"] == {}
+
+
+def test_failing_member_serves_fallback_and_counts_hits(tmp_path):
+    """A member that raises at predict time is replaced by the fallback value, counted per row"""
+    import asyncio
+
+    class BrokenTrees:
+        def __init__(self, n_features):
+            self.n_features_in_ = n_features
+
+        def predict(self, features):
+            raise RuntimeError("corrupt tree arrays")
+
+    model = _forecast_model(tmp_path)
+    model.gb_model = BrokenTrees(model.pipeline.ensemble_width)
+    model._validate_ensemble()
+    assert model.active_members == {"rf": True, "gb": True}
+
+    windows = np.random.default_rng(2).uniform(0, 300, (2, model.sequence_length, model.n_features))
+    lstm = model.lstm_infer(windows)[:, 0]
+    rf = model.rf_model.predict(model.pipeline.ensemble_input(windows))
+    np.testing.assert_allclose(model._ensemble_step(windows), 0.5 * lstm + 0.3 * rf + 0.2 * 150.0, rtol=1e-6)
+    assert model.get_fallback_stats()["fallback_hits"] == {"gb": 2}
+
+    asyncio.run(model.predict_batch([_history(30, 100)] * 2, [[], []], hours=3))
+    assert model.get_fallback_stats()["fallback_hits"] == {"gb": 2 + 2 * 3}
+
+
+def test_saturated_inference_returns_503_with_retry_after():
+    """Once every inference slot is taken the API sheds load with 503 and Retry-After"""
+    import threading
+    import time
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from inference_executor import InferenceExecutor, InferenceQueueFull
+    from main_enhanced import inference_queue_full_handler
+
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    gate = threading.Event()
+
+    # A throwaway app with the production handler, so no test route leaks into main_enhanced.app
+    app = FastAPI()
+    app.add_exception_handler(InferenceQueueFull, inference_queue_full_handler)
+
+    @app.get("/inference")
+    async def busy_inference():
+        return {"done": await executor.run(gate.wait, 10)}
+
+    client = TestClient(app)
+    first = {}
+    holder = threading.Thread(target=lambda: first.update(response=client.get("/inference")))
+    holder.start()
+    try:
+        deadline = time.time() + 10
+        while executor.in_flight == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        response = client.get("/inference")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert executor.stats()["rejected"] == 1
+    finally:
+        gate.set()
+        holder.join()
+        executor.shutdown()
+    assert first["response"].status_code == 200
+
+
+class StubForecastModel:
+    """Just enough of AQIPredictionModel for PredictionService's caching logic"""
+    max_horizon = 72
+    sequence_length = 24
+    n_features = 10
+
+    def get_accuracy(self):
+        return 94.3
+
+    def get_confidence_interval(self):
+        return 15.0
+
+
+def _counting_forecasts(service, delay=0.05):
+    """Replace the batched rollout with a slow stub that records each batch it runs"""
+    import asyncio
+
+    batches = []
+
+    async def forecast_batch(cities):
+        from datetime import datetime, timedelta
+        batches.append(list(cities))
+        await asyncio.sleep(delay)
+        now = datetime.now()
+        predictions = [
+            {"hour": h, "timestamp": (now + timedelta(hours=h)).isoformat(),
+             "predicted_aqi": 100 + len(batches), "confidence": 90.0}
+            for h in range(1, 73)
+        ]
+        return {city: await service._store_result(city, predictions) for city in cities}
+
+    service._forecast_batch = forecast_batch
+    return batches
+
+
+def test_concurrent_forecasts_for_a_city_share_one_batch():
+    """Callers arriving while a city's forecast is in flight await it instead of starting another"""
+    import asyncio
+    from ml.prediction_service import PredictionService
+
+    service = PredictionService(model=StubForecastModel(), cpcb_fetcher=object(), weather_fetcher=object())
+    batches = _counting_forecasts(service)
+
+    async def run():
+        return await asyncio.gather(*[service.batch_predict(["Delhi"], hours) for hours in (6, 24, 48, 72, 24)])
+
+    results = asyncio.run(run())
+    assert batches == [["Delhi"]]
+    assert [len(result["Delhi"]["predictions"]) for result in results] == [6, 24, 48, 72, 24]
+    assert service.get_cache_stats() == {"misses": 1, "coalesced": 4}
+    assert not service._inflight
+
+
+def test_stale_forecast_is_served_while_one_refresh_runs():
+    """An expired entry is answered immediately and refreshed once in the background"""
+    import asyncio
+    import time
+    from ml.prediction_service import PredictionService
+
+    service = PredictionService(model=StubForecastModel(), cpcb_fetcher=object(), weather_fetcher=object())
+    batches = _counting_forecasts(service)
+    stale = {"city": "Delhi", "predictions": [{"hour": 1, "predicted_aqi": 1}], "generated_at": 0}
+    service.cache.set("forecast:Delhi", (stale, time.time() - service.cache_duration - 1))
+
+    async def run():
+        served = await asyncio.gather(*[service.batch_predict(["Delhi"], 1) for _ in range(5)])
+        assert len(service._inflight) == 1
+        await asyncio.gather(*service._inflight.values())
+        return served, await service.batch_predict(["Delhi"], 1)
+
+    served, refreshed = asyncio.run(run())
+    assert all(result["Delhi"]["predictions"][0]["predicted_aqi"] == 1 for result in served)
+    assert batches == [["Delhi"]]
+    assert refreshed["Delhi"]["predictions"][0]["predicted_aqi"] == 101
+    assert service.get_cache_stats() == {"stale_hits": 5, "refreshes": 1, "hits": 1}
+
+
+# ==================== Cache ====================
+
+def test_workers_share_sqlite_cache(tmp_path):
+    """A value cached by one worker is served to another through the shared tier"""
+    from cache import Cache, SQLiteCacheBackend
+
+    path = str(tmp_path / "cache.db")
+    worker_a = Cache(l2=SQLiteCacheBackend(path))
+    worker_b = Cache(l2=SQLiteCacheBackend(path))
+
+    worker_a.set(("forecast", "Delhi"), {"aqi": [180, 175]}, ttl=60)
+    assert worker_b.get(("forecast", "Delhi")) == {"aqi": [180, 175]}
+    assert worker_b.stats['l2_hits'] == 1
+
+    # Served from L1 on the second read
+    worker_b.get(("forecast", "Delhi"))
+    assert worker_b.stats['hits'] == 1
+
+    worker_a.set("expired", 1, ttl=-1)
+    assert worker_b.get("expired") is None
+
+
+def test_cached_methods_share_l2_entries_across_instances(tmp_path):
+    """Decorated methods on different instances (and workers) hit the same shared entry"""
+    import asyncio
+    from cache import Cache, SQLiteCacheBackend
+
+    path = str(tmp_path / "cache.db")
+    calls = []
+
+    def make_fetcher(cache):
+        class Fetcher:
+            @cache.cached(ttl=60)
+            async def current(self, city, unit="aqi"):
+                calls.append(city)
+                return {"city": city, unit: 180}
+
+            @cache.cached(ttl=60, key=lambda self, readings: len(readings))
+            async def summarize(self, readings):
+                calls.append("summarize")
+                return sum(readings)
+
+        return Fetcher()
+
+    worker_a = make_fetcher(Cache(l2=SQLiteCacheBackend(path)))
+    worker_b = make_fetcher(Cache(l2=SQLiteCacheBackend(path)))
+
+    async def run():
+        first = await worker_a.current("Delhi")
+        assert await worker_b.current("Delhi") == first
+        assert await worker_b.current("Delhi", unit="pm25") == {"city": "Delhi", "pm25": 180}
+        assert await worker_a.summarize([1, 2]) == await worker_b.summarize([1, 2]) == 3
+
+    asyncio.run(run())
+    assert calls == ["Delhi", "Delhi", "summarize"]
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis-py calls RedisCacheBackend makes, with a slow get"""
+
+    def __init__(self, delay=0.0):
+        self.data, self.delay, self.threads = {}, delay, set()
+
+    def set(self, key, value, px):
+        self.data[key] = (value, px)
+
+    def pipeline(self):
+        client, calls = self, []
+
+        class Pipeline:
+            def get(self, key):
+                calls.append(key)
+
+            def pttl(self, key):
+                pass
+
+            def execute(self):
+                import threading
+                import time
+                client.threads.add(threading.current_thread().name)
+                time.sleep(client.delay)
+                value, px = client.data.get(calls[0], (None, -2))
+                return [value, px]
+        return Pipeline()
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if key.startswith(match.rstrip("*"))]
+
+
+def test_redis_backend_runs_off_the_event_loop():
+    """Redis L2 round-trips keys with their TTL, and async reads leave the loop free"""
+    import asyncio
+    import threading
+    from cache import Cache, RedisCacheBackend
+
+    client = FakeRedis(delay=0.2)
+    backend = RedisCacheBackend(client=client, prefix="test:")
+    writer, reader = Cache(l2=backend), Cache(l2=backend)
+    writer.set("forecast:Delhi", {"aqi": 180}, ttl=60)
+    assert client.data["test:forecast:Delhi"][1] == 60000
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        value = await reader.aget("forecast:Delhi")
+        task.cancel()
+        return value, ticks
+
+    value, ticks = asyncio.run(run())
+    assert value == {"aqi": 180} and reader.stats['l2_hits'] == 1
+    assert ticks >= 10 and threading.current_thread().name not in client.threads
+
+    backend.clear()
+    assert client.data == {}
+
+
+def test_stale_forecast_prefers_a_fresher_shared_entry(tmp_path):
+    """A worker holding a stale L1 forecast picks up another worker's refresh instead of recomputing"""
+    import asyncio
+    import time
+    from cache import SQLiteCacheBackend
+    from ml.prediction_service import PredictionService
+
+    workers = [PredictionService(model=StubForecastModel(), cpcb_fetcher=object(), weather_fetcher=object())
+               for _ in range(2)]
+    for worker in workers:
+        worker.cache.l2 = SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    stale_worker, fresh_worker = workers
+    batches = _counting_forecasts(stale_worker)
+
+    stale = {"city": "Delhi", "predictions": [{"hour": 1, "predicted_aqi": 1}], "generated_at": 0}
+    stale_worker.cache._set_local("forecast:Delhi", (stale, time.time() - stale_worker.cache_duration - 1), 3600)
+    fresh = {"city": "Delhi", "predictions": [{"hour": 1, "predicted_aqi": 2}], "generated_at": time.time()}
+    fresh_worker.cache.set("forecast:Delhi", (fresh, fresh["generated_at"]))
+
+    result = asyncio.run(stale_worker.batch_predict(["Delhi"], 1))
+    assert result["Delhi"]["predictions"][0]["predicted_aqi"] == 2
+    assert batches == [] and not stale_worker._inflight
+    assert stale_worker.get_cache_stats() == {"hits": 1}
+
+
+def test_forecast_scheduler_skips_cities_refreshed_by_another_worker(tmp_path):
+    """Workers sharing L2 refresh each city once per interval and re-runs replace stored rows"""
+    import asyncio
+    from cache import SQLiteCacheBackend
+    from database import init_db, SessionLocal, Prediction
+    from forecast_scheduler import ForecastScheduler
+    from ml.prediction_service import PredictionService
+
+    init_db()
+    db = SessionLocal()
+    db.query(Prediction).filter(Prediction.city.in_(["Jaipur", "Lucknow"])).delete(synchronize_session=False)
+    db.commit()
+
+    schedulers = []
+    for _ in range(2):
+        service = PredictionService(model=StubForecastModel(), cpcb_fetcher=object(), weather_fetcher=object())
+        service.cache.l2 = SQLiteCacheBackend(str(tmp_path / "cache.db"))
+        schedulers.append(ForecastScheduler(service, cities=["Jaipur", "Lucknow"], interval=1800, jitter=0))
+    first, second = schedulers
+    first_batches = _counting_forecasts(first.service)
+    second_batches = _counting_forecasts(second.service)
+
+    async def run():
+        await first.run_once()
+        await second.run_once()
+        # Forecasts count as due again once half an interval has passed
+        first.interval = 1e-6
+        await first.run_once()
+
+    asyncio.run(run())
+    try:
+        assert first_batches == [["Jaipur", "Lucknow"]] * 2 and second_batches == []
+        assert second.stats()["skipped"] == 2
+        stored = db.query(Prediction).filter(Prediction.city.in_(["Jaipur", "Lucknow"])).all()
+        assert len(stored) == 2 * 72
+        assert {row.predicted_aqi for row in stored} == {102}
+    finally:
+        db.close()
+
+
+def test_forecast_scheduler_claims_cities_through_the_database():
+    """Without a shared cache tier, the refresh claim still gives each city to one worker per interval"""
+    import asyncio
+    from database import init_db, SessionLocal, ForecastRefresh
+    from forecast_scheduler import ForecastScheduler
+    from ml.prediction_service import PredictionService
+
+    init_db()
+    cities = ["Agra", "Kanpur"]
+    db = SessionLocal()
+    try:
+        db.query(ForecastRefresh).filter(ForecastRefresh.city.in_(cities)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    schedulers = [
+        ForecastScheduler(PredictionService(model=StubForecastModel(), cpcb_fetcher=object(), weather_fetcher=object()),
+                          cities=cities, interval=1800, jitter=0)
+        for _ in range(3)
+    ]
+    batches = [_counting_forecasts(scheduler.service) for scheduler in schedulers]
+
+    async def run():
+        await asyncio.gather(*[scheduler.run_once() for scheduler in schedulers])
+
+    asyncio.run(run())
+    assert sorted(city for worker in batches for batch in worker for city in batch) == cities
+    assert sum(scheduler.stats()["skipped"] for scheduler in schedulers) == 2 * len(cities)
+
+
+def test_cache_evicts_lru_expired_and_over_budget_entries():
+    """L1 drops the least recently used entry, expired entries and whatever exceeds max_bytes"""
+    import sys
+    import time
+    from cache import Cache, approximate_size
+
+    cache = Cache(default_ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats['evictions'] == 1
+
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.stats['expirations'] == 1
+
+    # An array that owns its data is counted once; a view adds the bytes it shows
+    array = np.zeros(1000)
+    assert approximate_size(array) == sys.getsizeof(array) < 1.1 * array.nbytes
+    assert approximate_size(array[:500]) == sys.getsizeof(array[:500]) + 500 * 8
+
+    budget = Cache(default_ttl=60, max_entries=100, max_bytes=3 * approximate_size(array) + 100)
+    for i in range(4):
+        budget.set(i, np.zeros(1000))
+    assert [budget.get(i) is not None for i in range(4)] == [False, True, True, True]
+    assert budget.get_stats()['bytes'] == 3 * approximate_size(array)
+
+
+# ==================== Data Fetchers ====================
+
+def _per_city_realtime(fetcher, now):
+    """The realtime records as the original per-city loop generated them"""
+    data = []
+    for city, config in fetcher.cities_config.items():
+        base_aqi = fetcher.cities.get_base_aqi(city)
+        time_factor = fetcher._get_time_factor(now)
+        seasonal_factor = fetcher._get_seasonal_factor(now)
+
+        aqi = int(base_aqi * time_factor * seasonal_factor + np.random.randint(-20, 20))
+        aqi = max(50, min(450, aqi))
+        data.append({
+            "city": city,
+            "aqi": aqi,
+            "pm25": int(aqi * 0.6 + np.random.randint(-10, 10)),
+            "pm10": int(aqi * 0.8 + np.random.randint(-15, 15)),
+            "no2": int(aqi * 0.15 + np.random.randint(-5, 5)),
+            "so2": int(aqi * 0.08 + np.random.randint(-3, 3)),
+            "co": round(aqi * 0.01 + np.random.uniform(-0.5, 0.5), 2),
+            "o3": int(aqi * 0.12 + np.random.randint(-5, 5)),
+            "timestamp": now.isoformat(),
+            "lat": config['lat'],
+            "lng": config['lng']
+        })
+    return data
+
+
+def test_vectorized_snapshot_matches_per_city_records(monkeypatch):
+    """fetch_realtime expands the columnar snapshot into exactly the per-city loop's records"""
+    import asyncio
+    from datetime import datetime
+    from cache import cache
+    from data_fetcher import CPCBDataFetcher
+
+    fetcher = CPCBDataFetcher()
+    fetcher.cpcb_api_key = ""
+
+    async def realtime(now):
+        await cache.aset("realtime:snapshot", fetcher._build_snapshot(now), ttl=60)
+        try:
+            return await fetcher.fetch_realtime()
+        finally:
+            cache.delete("realtime:snapshot")
+
+    # Real noise: same cities, fields and types, every value within the loop's ranges
+    now = datetime(2024, 1, 15, 3, 0)  # 08:30 IST, peak traffic in winter
+    records = asyncio.run(realtime(now))
+    reference = _per_city_realtime(fetcher, now)
+    assert [r["city"] for r in records] == [r["city"] for r in reference]
+    for record, expected in zip(records, reference):
+        assert {k: type(v) for k, v in record.items()} == {k: type(v) for k, v in expected.items()}
+        base = fetcher.cities.get_base_aqi(record["city"]) * 1.3 * 1.5
+        assert np.clip(base - 21, 50, 450) <= record["aqi"] <= np.clip(base + 20, 50, 450)
+
+    # Pinned noise: the records are identical, for every time and seasonal factor
+    def lowest(low, high, size=None):
+        return low if size is None else np.broadcast_to(low, size).copy()
+
+    monkeypatch.setattr(np.random, "randint", lowest)
+    monkeypatch.setattr(np.random, "uniform", lowest)
+    for now in (datetime(2024, 1, 15, 8), datetime(2024, 3, 2, 13), datetime(2024, 7, 9, 23), datetime(2024, 10, 1, 19)):
+        assert asyncio.run(realtime(now)) == _per_city_realtime(fetcher, now)
+
+
+def test_cpcb_fetcher_retries_against_mock_server():
+    """City requests go through the shared client and survive a transient 503"""
+    import asyncio
+    from datetime import datetime
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from http_client import HTTPClient
+    from data_fetcher import CPCBDataFetcher
+
+    calls = []
+
+    async def resource(request):
+        city = request.query["filters[city]"]
+        calls.append(city)
+        if calls.count(city) == 1 and city == "Delhi":
+            return web.Response(status=503)
+        return web.json_response({"records": [
+            {"city": city, "station": "A", "pollutant_id": "PM2.5", "avg_value": "180"},
+            {"city": city, "station": "B", "pollutant_id": "PM2.5", "avg_value": "220"},
+            {"city": city, "station": "A", "pollutant_id": "NO2", "avg_value": "NA"},
+            {"city": city, "station": "A", "pollutant_id": "OZONE", "avg_value": "45"}
+        ]})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/resource", resource)
+        async with TestServer(app) as server:
+            client = HTTPClient(retries=2, backoff=0.01)
+            fetcher = CPCBDataFetcher(client)
+            fetcher.cpcb_api_key = "test-key"
+            fetcher.base_url = str(server.make_url("/resource"))
+            try:
+                return await fetcher._fetch_snapshot(datetime.now())
+            finally:
+                await client.close()
+
+    snapshot = asyncio.run(run())
+
+    assert sorted(calls) == sorted(list(snapshot["cities"]) + ["Delhi"])
+    # PM2.5 at 200 ug/m3 is Very Poor (121-250 -> 301-400), well above the ozone sub-index
+    assert snapshot["aqi"][snapshot["cities"].index("Delhi")] == round(300 + (200 - 120) * 100 / 130)
+    assert snapshot["pm25"][0] == 200 and snapshot["o3"][0] == 45
+
+
+def test_cpcb_sub_indices_follow_breakpoints():
+    """Concentrations map onto the CPCB bands, so the AQI is comparable across pollutants"""
+    from data_fetcher import sub_index
+
+    assert sub_index("pm25", 30) == 50 and sub_index("pm10", 100) == 100
+    assert sub_index("no2", 130) == 150
+    assert sub_index("co", 1.5) == 75
+    assert sub_index("o3", 748) == 400 and sub_index("so2", 5000) == 500
+
+
+def test_nasa_fetcher_uses_the_shared_client():
+    """Satellite requests go through the shared HTTP client and fall back to generated data"""
+    import asyncio
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from http_client import HTTPClient
+    from data_fetcher import NASADataFetcher
+
+    async def columns(request):
+        assert request.query["api_key"] == "test-key"
+        return web.json_response({"aerosol_optical_depth": 0.42, "no2_column": 3e15, "so2_column": 1.1})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/columns", columns)
+        async with TestServer(app) as server:
+            client = HTTPClient(retries=0)
+            fetcher = NASADataFetcher(client)
+            fetcher.api_key = "test-key"
+            fetcher.base_url = str(server.make_url("/columns"))
+            try:
+                live = await fetcher.fetch_satellite_data(28.7, 77.1, "2024-01-01")
+                fetcher.base_url = str(server.make_url("/missing"))
+                fallback = await fetcher.fetch_satellite_data(28.7, 77.1, "2024-01-01")
+                return live, fallback
+            finally:
+                await client.close()
+
+    live, fallback = asyncio.run(run())
+    assert live == {"aerosol_optical_depth": 0.42, "no2_column": 3e15, "so2_column": 1.1,
+                    "source": "NASA EARTHDATA", "quality": "high"}
+    assert fallback["source"] == "NASA MODIS"
+
+
+# ==================== Database ====================
+
+def test_bulk_store_aqi_readings_in_batches():
+    """Streamed readings are written in batches with ISO timestamps parsed"""
+    from database import init_db, SessionLocal, AQIReading, DatabaseOperations
+
+    init_db()
+    readings = (
+        {"city": "Delhi", "aqi": 200 + i, "pm25": 120.0, "timestamp": f"2024-01-01T00:{i:02d}:00"}
+        for i in range(25)
+    )
+    db = SessionLocal()
+    try:
+        db.query(AQIReading).delete()
+        result = DatabaseOperations.bulk_store_aqi_readings(db, readings, batch_size=10)
+
+        assert result["rows"] == 25
+        assert db.query(AQIReading).count() == 25
+        latest = DatabaseOperations.get_city_readings(db, "Delhi", limit=1)[0]
+        assert latest.aqi == 224 and latest.timestamp.minute == 24 and latest.no2 is None
+    finally:
+        db.close()
+
+
+def test_bulk_store_skips_readings_already_stored():
+    """A retried batch and a second worker's overlapping batch store each reading once"""
+    from datetime import datetime
+    from database import init_db, SessionLocal, AQIReading, aqi_rollup_hourly, aqi_rollup_daily, DatabaseOperations
+    import rollups
+
+    init_db()
+    readings = [{"city": "Kochi", "aqi": 100 + i, "timestamp": datetime(2024, 5, 1, 0, i)} for i in range(30)]
+    db = SessionLocal()
+    try:
+        for table in (AQIReading.__table__, aqi_rollup_hourly, aqi_rollup_daily):
+            db.execute(table.delete())
+        assert DatabaseOperations.bulk_store_aqi_readings(db, readings[:20])["rows"] == 20
+        # Requeued batch
+        assert DatabaseOperations.bulk_store_aqi_readings(db, readings[:20])["skipped"] == 20
+        # Another worker polled an overlapping snapshot
+        result = DatabaseOperations.bulk_store_aqi_readings(db, readings[10:], batch_size=7)
+        assert (result["rows"], result["skipped"]) == (10, 10)
+
+        assert db.query(AQIReading).filter(AQIReading.city == "Kochi").count() == 30
+        summary = rollups.summarize(db, ["Kochi"], datetime(2024, 5, 1), datetime(2024, 5, 2))
+        assert summary["Kochi"]["count"] == 30
+        assert summary["Kochi"]["avg"] == pytest.approx(114.5)
+    finally:
+        db.close()
+
+
+def test_single_reading_writes_update_rollups():
+    """Readings stored one at a time, sync or async, land in the rollups like bulk ones"""
+    import asyncio
+    from datetime import datetime
+    from database import (init_db, SessionLocal, async_engine, AsyncSessionLocal,
+                          DatabaseOperations, AsyncDatabaseOperations)
+    import rollups
+
+    init_db()
+    day = datetime(2024, 6, 1)
+
+    async def store_async():
+        try:
+            async with AsyncSessionLocal() as db:
+                await AsyncDatabaseOperations.store_aqi_reading(
+                    db, {"city": "Surat", "aqi": 300, "timestamp": datetime(2024, 6, 1, 9)})
+        finally:
+            await async_engine.dispose()
+
+    db = SessionLocal()
+    try:
+        DatabaseOperations.store_aqi_reading(db, {"city": "Surat", "aqi": 100, "pm25": 40.0,
+                                                  "timestamp": datetime(2024, 6, 1, 8, 30)})
+        asyncio.run(store_async())
+
+        hourly = rollups.get_history(db, "Surat", day, datetime(2024, 6, 2), resolution="hour")
+        assert [(row["timestamp"][-8:], row["aqi"]) for row in hourly] == [("08:00:00", 100), ("09:00:00", 300)]
+        summary = rollups.summarize(db, ["Surat"], day, datetime(2024, 6, 2))
+        assert (summary["Surat"]["count"], summary["Surat"]["avg"]) == (2, 200)
+    finally:
+        db.close()
+
+
+def test_ingestion_worker_dedupes_and_flushes():
+    """Repeated snapshots are stored once and failed flushes keep rows buffered"""
+    import asyncio
+    from database import init_db, SessionLocal, AQIReading
+    from ingestion import IngestionWorker
+
+    class SnapshotFetcher:
+        def __init__(self):
+            self.timestamp = "2024-01-01T10:00:00"
+
+        async def fetch_realtime(self):
+            return [{"city": city, "aqi": 150, "timestamp": self.timestamp}
+                    for city in ("Delhi", "Pune")]
+
+    init_db()
+    db = SessionLocal()
+    db.query(AQIReading).delete()
+    db.commit()
+
+    fetcher = SnapshotFetcher()
+    observed = []
+    worker = IngestionWorker(fetcher=fetcher, interval=60, max_buffer=3, on_stored=observed.append)
+
+    async def run():
+        assert await worker.poll_once() == 2
+        assert await worker.poll_once() == 0  # same snapshot again
+
+        fetcher.timestamp = "2024-01-01T10:05:00"
+        worker._write = lambda rows: 1 / 0
+        assert await worker.poll_once() == 0
+        assert len(worker.buffer) == 2
+
+        del worker._write
+        await worker.stop()
+
+    asyncio.run(run())
+    try:
+        assert db.query(AQIReading).count() == 4
+        assert worker.stats()["duplicates"] == 2
+        assert [reading["timestamp"][-8:] for reading in observed] == ["10:00:00"] * 2 + ["10:05:00"] * 2
+    finally:
+        db.close()
+
+
+def test_rolling_window_keeps_time_order_past_capacity():
+    """Pushing past capacity overwrites the oldest rows and to_array stays oldest to newest"""
+    from feature_pipeline import RollingFeatureWindow
+
+    window = RollingFeatureWindow(sequence_length=4, n_features=10)
+    window.extend({"aqi": aqi} for aqi in (100, 110))
+    assert not window.is_full
+    assert window.to_array()[:, 0].tolist() == [100, 100, 100, 110]
+
+    window.extend({"aqi": aqi} for aqi in (120, 130, 140, 150, 160))
+    assert window.is_full
+    assert window.to_array()[:, 0].tolist() == [130, 140, 150, 160]
+
+
+def test_observed_readings_advance_the_forecast_window_hourly():
+    """The window is seeded once from hourly rollups and then moved by observe(), one row per hour"""
+    import asyncio
+
+    class HourlyFetcher:
+        def __init__(self):
+            self.calls = 0
+
+        async def fetch_hourly_history(self, city, hours=24):
+            self.calls += 1
+            return [{"date": f"2024-01-01T{hour}:00:00", "aqi": aqi, "city": city}
+                    for hour, aqi in (("10", 100), ("11", 110), ("12", 120))]
+
+    class Weather:
+        async def fetch_forecast(self, city, hours=72):
+            return []
+
+    from ml.prediction_service import PredictionService
+
+    fetcher = HourlyFetcher()
+    service = PredictionService(model=StubForecastModel(), cpcb_fetcher=fetcher, weather_fetcher=Weather())
+    service.observe({"city": "Delhi", "aqi": 500, "timestamp": "2024-01-01T12:30:00"})  # no window yet
+
+    async def aqi_input():
+        window, _ = await service._fetch_inputs("Delhi", 72)
+        return window[:, 0].tolist()
+
+    seeded = asyncio.run(aqi_input())
+    assert seeded[-4:] == [100, 100, 110, 120]
+
+    for reading in ({"aqi": 140, "timestamp": "2024-01-01T12:05:00"},   # averaged into 12:00
+                    {"aqi": 200, "timestamp": "2024-01-01T14:10:00"},   # 13:00 repeats 12:00
+                    {"aqi": 900, "timestamp": "2024-01-01T11:55:00"}):  # older than the window
+        service.observe({"city": "Delhi", **reading})
+
+    observed = asyncio.run(aqi_input())
+    assert observed[-5:] == [100, 110, 130, 130, 200]
+    assert fetcher.calls == 1  # a partly filled window is not reseeded
+
+
+def test_migrate_reports_duplicates_unless_asked_to_drop_them(tmp_path):
+    """A unique index is not built over duplicate rows until the operator opts into removing them"""
+    from sqlalchemy import create_engine, inspect, text
+    from database import Base
+    from migrations import migrate
+
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_aqi_readings_city_timestamp"))
+        conn.execute(text("CREATE INDEX ix_aqi_readings_city_timestamp ON aqi_readings (city, timestamp DESC)"))
+        for aqi in (100, 110, 120):
+            conn.execute(text("INSERT INTO aqi_readings (city, aqi, timestamp) VALUES ('Delhi', :aqi, '2024-01-01 00:00:00')"),
+                         {"aqi": aqi})
+
+    def state():
+        with engine.connect() as conn:
+            aqi = [row[0] for row in conn.execute(text("SELECT aqi FROM aqi_readings ORDER BY id"))]
+        return aqi, {index["name"] for index in inspect(engine).get_indexes("aqi_readings")}
+
+    assert migrate(engine) == ["skipped uq_aqi_readings_city_timestamp: 2 duplicate aqi_readings rows"]
+    aqi, indexes = state()
+    assert aqi == [100, 110, 120] and "ix_aqi_readings_city_timestamp" in indexes
+
+    assert migrate(engine, drop_duplicates=True) == [
+        "removed 2 duplicate aqi_readings rows", "created uq_aqi_readings_city_timestamp",
+        "dropped ix_aqi_readings_city_timestamp"
+    ]
+    aqi, indexes = state()
+    assert aqi == [120] and "uq_aqi_readings_city_timestamp" in indexes
+    assert migrate(engine) == []
+    engine.dispose()
+
+
+def test_hot_queries_use_indexes():
+    """EXPLAIN shows each hot DatabaseOperations query served by its index, with no sort step"""
+    from sqlalchemy import event
+    from database import init_db, engine, SessionLocal, DatabaseOperations
+    from migrations import migrate
+
+    init_db()
+    migrate(engine)
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    db = SessionLocal()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        DatabaseOperations.get_city_readings(db, "Delhi")
+        DatabaseOperations.get_verified_reports(db)
+        DatabaseOperations.get_user_activity(db, "user-1")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert len(statements) == 3
+    expected = [
+        "uq_aqi_readings_city_timestamp",
+        "ix_community_reports_verified_votes",
+        "ix_user_activity_user_created"
+    ]
+    try:
+        for (statement, parameters), index_name in zip(statements, expected):
+            plan = " | ".join(
+                row[-1] for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            )
+            assert f"USING INDEX {index_name}" in plan, plan
+            assert "TEMP B-TREE" not in plan, plan
+    finally:
+        db.close()
+
+
+def test_rollups_match_raw_readings():
+    """Summaries stitched from daily, hourly and raw pieces equal a scan of the raw rows"""
+    from datetime import datetime, timedelta
+    from database import init_db, SessionLocal, AQIReading, aqi_rollup_hourly, aqi_rollup_daily, DatabaseOperations
+    import rollups
+
+    init_db()
+    rng = np.random.default_rng(1)
+    start = datetime(2024, 3, 1)
+    readings = [
+        {"city": city, "aqi": float(rng.uniform(50, 400)), "timestamp": start + timedelta(minutes=10 * i)}
+        for i in range(5 * 24 * 6) for city in ("Delhi", "Pune")
+    ]
+
+    db = SessionLocal()
+    try:
+        for table in (AQIReading.__table__, aqi_rollup_hourly, aqi_rollup_daily):
+            db.execute(table.delete())
+        # Two ingests with uneven batches so buckets are merged across upserts
+        DatabaseOperations.bulk_store_aqi_readings(db, readings[:1001], batch_size=300)
+        DatabaseOperations.bulk_store_aqi_readings(db, readings[1001:], batch_size=700)
+
+        window_start, window_end = datetime(2024, 3, 1, 5, 25), datetime(2024, 3, 4, 17, 35)
+        assert [piece[0] for piece in rollups.split_range(window_start, window_end)] == \
+            ['raw', 'hour', 'day', 'hour', 'raw']
+
+        summary = rollups.summarize(db, ["Delhi", "Pune"], window_start, window_end)
+        for city in ("Delhi", "Pune"):
+            values = [r["aqi"] for r in readings if r["city"] == city and window_start <= r["timestamp"] < window_end]
+            assert summary[city]["count"] == len(values)
+            assert summary[city]["avg"] == pytest.approx(np.mean(values), abs=0.01)
+            assert (summary[city]["min"], summary[city]["max"]) == (min(values), max(values))
+
+        daily = rollups.get_history(db, "Delhi", start, start + timedelta(days=5))
+        assert len(daily) == 5 and all(day["count"] == 144 for day in daily)
+    finally:
+        db.close()
+
+
+def test_compare_endpoint_summarizes_from_rollups():
+    """/compare answers per-city stats through rollups.summarize"""
+    from datetime import datetime, timedelta
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from database import init_db, SessionLocal, async_engine, DatabaseOperations
+    from routes import router
+
+    init_db()
+    start = datetime(2024, 4, 1)
+    db = SessionLocal()
+    try:
+        DatabaseOperations.bulk_store_aqi_readings(db, [
+            {"city": city, "aqi": aqi + i, "pm25": 40.0, "timestamp": start + timedelta(hours=i)}
+            for i in range(48) for city, aqi in (("Indore", 100), ("Bhopal", 200))
+        ])
+    finally:
+        db.close()
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    client = TestClient(app)
+    try:
+        params = {"cities": "Indore, Bhopal", "start": "2024-04-01T12:00:00", "end": "2024-04-02T12:00:00"}
+        response = client.get("/api/v1/compare", params=params).json()
+        assert response["metric"] == "aqi"
+        assert response["cities"]["Indore"] == {"count": 24, "avg": 123.5, "min": 112, "max": 135}
+        assert response["cities"]["Bhopal"]["avg"] == 223.5
+
+        pm25 = client.get("/api/v1/compare", params={**params, "metric": "pm25", "cities": "Indore"}).json()
+        assert pm25["cities"] == {"Indore": {"count": 24, "avg": 40.0, "min": 40.0, "max": 40.0}}
+        assert client.get("/api/v1/compare", params={**params, "metric": "pollen"}).status_code == 400
+        assert client.get("/api/v1/compare", params={**params, "start": params["end"]}).status_code == 400
+    finally:
+        client.close()
+        import asyncio
+        asyncio.run(async_engine.dispose())
+
+
+def test_async_database_operations():
+    """The async layer reads and writes through aiosqlite alongside the sync engine"""
+    import asyncio
+    from database import init_db, async_engine, AsyncSessionLocal, AsyncDatabaseOperations
+
+    init_db()
+
+    async def run():
+        try:
+            async with AsyncSessionLocal() as db:
+                await AsyncDatabaseOperations.ping(db)
+                before = await AsyncDatabaseOperations.get_table_counts(db)
+                await AsyncDatabaseOperations.store_aqi_reading(db, {"city": "Lucknow", "aqi": 210})
+                profile = await AsyncDatabaseOperations.update_user_points(db, "async-user", 250)
+                after = await AsyncDatabaseOperations.get_table_counts(db)
+                readings = await AsyncDatabaseOperations.get_city_readings(db, "Lucknow")
+                return before, after, profile, readings
+        finally:
+            await async_engine.dispose()
+
+    before, after, profile, readings = asyncio.run(run())
+    assert after["aqi_readings"] == before["aqi_readings"] + 1
+    assert after["user_profiles"] == before["user_profiles"] + 1
+    assert profile.total_points == 250 and profile.level == 3
+    assert readings[0].aqi == 210
+
+
+def test_stats_counters_track_writes():
+    """Write paths keep the counters exact between recounts, and stale counters are recounted"""
+    from database import init_db, SessionLocal, AQIReading, StatsCounter, DatabaseOperations
+
+    init_db()
+    db = SessionLocal()
+    try:
+        before = DatabaseOperations.refresh_counters(db)
+        DatabaseOperations.store_aqi_reading(db, {"city": "Pune", "aqi": 150})
+        DatabaseOperations.bulk_store_aqi_readings(
+            db, [{"city": "Pune", "aqi": 160 + i, "timestamp": f"2024-02-01T0{i}:00:00"} for i in range(3)]
+        )
+        DatabaseOperations.store_community_report(
+            db, {"user_id": "counter-user", "location": "Pune", "lat": 18.5, "lng": 73.8,
+                 "pollution_type": "Dust", "verified": True}
+        )
+        DatabaseOperations.get_user_profile(db, "counter-user")
+
+        counters, refreshed_at = DatabaseOperations.get_stats_counters(db, max_staleness=3600)
+        assert counters == DatabaseOperations.get_table_counts(db)
+        assert counters["aqi_readings"] == before["aqi_readings"] + 4
+        assert counters["verified_reports"] == before["verified_reports"] + 1
+        assert counters["user_profiles"] == before["user_profiles"] + 1
+
+        # Writes that bypass DatabaseOperations drift until the next recount
+        db.query(AQIReading).filter(AQIReading.city == "Pune").delete()
+        db.commit()
+        drifted, _ = DatabaseOperations.get_stats_counters(db, max_staleness=3600)
+        assert drifted["aqi_readings"] == counters["aqi_readings"]
+        db.query(StatsCounter).update({StatsCounter.refreshed_at: refreshed_at.replace(year=2000)})
+        db.commit()
+        recounted, _ = DatabaseOperations.get_stats_counters(db, max_staleness=3600)
+        assert recounted == DatabaseOperations.get_table_counts(db)
+        assert recounted["aqi_readings"] < drifted["aqi_readings"]
+    finally:
+        db.close()
+
+
+def test_workers_seeding_stats_counters_at_once_do_not_collide():
+    """First-boot recounts from several workers upsert the same counter rows without IntegrityError"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from database import init_db, SessionLocal, StatsCounter, DatabaseOperations
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(StatsCounter).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    barrier = threading.Barrier(4)
+
+    def seed(_):
+        session = SessionLocal()
+        try:
+            session.query(StatsCounter).all()  # every worker sees no counters yet
+            barrier.wait()
+            return DatabaseOperations.refresh_counters(session)
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(seed, range(4)))
+
+    db = SessionLocal()
+    try:
+        counters, _ = DatabaseOperations.get_stats_counters(db, max_staleness=3600)
+        assert all(result == counters for result in results)
+        assert db.query(StatsCounter).count() == len(counters)
+    finally:
+        db.close()
+
+
+def test_concurrent_votes_and_points_lose_no_updates():
+    """Racing sessions increment votes and points atomically, and the aggregator batches votes"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from database import init_db, SessionLocal, CommunityReport, UserProfile, DatabaseOperations
+    from vote_aggregator import VoteAggregator
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(UserProfile).filter(UserProfile.user_id == "racer").delete()
+        db.commit()
+        report = DatabaseOperations.store_community_report(
+            db, {"user_id": "racer", "location": "Delhi", "lat": 28.7, "lng": 77.1}
+        )
+        report_id = report.id
+    finally:
+        db.close()
+
+    def vote_and_score(_):
+        session = SessionLocal()
+        try:
+            for _ in range(10):
+                DatabaseOperations.update_report_votes(session, report_id)
+                DatabaseOperations.update_user_points(session, "racer", 10)
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(vote_and_score, range(8)))
+
+    async def burst():
+        aggregator = VoteAggregator(interval=60)
+        for _ in range(50):
+            aggregator.add(report_id)
+        updated = await aggregator.flush()
+        return updated, aggregator.stats()
+
+    updated, stats = asyncio.run(burst())
+    assert updated == 1 and stats["coalesced"] == 49 and stats["pending_votes"] == 0
+
+    db = SessionLocal()
+    try:
+        assert db.get(CommunityReport, report_id).votes == 80 + 50
+        profile = db.query(UserProfile).filter(UserProfile.user_id == "racer").one()
+        assert profile.total_points == 800 and profile.level == 9
+    finally:
+        db.close()
+
+
+def test_vote_endpoint_batches_votes_through_the_aggregator():
+    """Votes posted to the API reach the database in one flush of app.state.vote_aggregator"""
+    import asyncio
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from database import init_db, SessionLocal, async_engine, CommunityReport, DatabaseOperations
+    from routes import router
+    from vote_aggregator import VoteAggregator
+
+    init_db()
+    db = SessionLocal()
+    try:
+        report_id = DatabaseOperations.store_community_report(
+            db, {"user_id": "voter", "location": "Agra", "lat": 27.2, "lng": 78.0}
+        ).id
+    finally:
+        db.close()
+
+    def stored_votes():
+        session = SessionLocal()
+        try:
+            return session.get(CommunityReport, report_id).votes
+        finally:
+            session.close()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.vote_aggregator = VoteAggregator(interval=60)
+        app.state.vote_aggregator.start()
+        yield
+        await app.state.vote_aggregator.stop()
+        await async_engine.dispose()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router, prefix="/api/v1")
+    with TestClient(app) as client:
+        for n in range(1, 6):
+            response = client.post(f"/api/v1/community/reports/{report_id}/vote")
+            assert response.status_code == 202 and response.json()["pending_votes"] == n
+        assert client.post("/api/v1/community/reports/999999/vote").status_code == 404
+        assert stored_votes() == 0  # nothing written before the flush
+
+        stats = app.state.vote_aggregator.stats()
+        assert (stats["votes"], stats["coalesced"], stats["pending_votes"]) == (5, 4, 5)
+
+    # Shutdown flushes the pending votes in one batched update
+    assert stored_votes() == 5
+    stats = app.state.vote_aggregator.stats()
+    assert (stats["flushes"], stats["reports_updated"], stats["pending_votes"]) == (1, 1, 0)
+
+
+# ==================== Leaderboard ====================
+
+def test_ranked_list_matches_sorted_list():
+    """Random adds and removes keep order and positions identical to a plain sorted list"""
+    import random
+    from leaderboard import RankedList
+
+    rng = random.Random(0)
+    keys = [(rng.randint(-1000, 0), f"user{i}") for i in range(3000)]
+    ranked, expected = RankedList(keys[:1000], load=16), sorted(keys[:1000])
+    for key in keys[1000:]:
+        if expected and rng.random() < 0.4:
+            victim = expected.pop(rng.randrange(len(expected)))
+            ranked.remove(victim)
+        ranked.add(key)
+        expected.append(key)
+        expected.sort()
+
+    assert list(ranked) == expected and len(ranked) == len(expected)
+    for key in rng.sample(expected, 200):
+        assert ranked.index(key) == expected.index(key)
+    with pytest.raises(ValueError):
+        ranked.remove((1, "missing"))
+
+
+def test_leaderboard_follows_points_updates():
+    """Awarding points moves users on the board served by /api/v1/leaderboard"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from database import init_db, SessionLocal, UserProfile, DatabaseOperations
+    from leaderboard import leaderboard
+    from routes import router
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(UserProfile).filter(UserProfile.user_id.like("board-%")).delete(synchronize_session=False)
+        db.commit()
+        DatabaseOperations.rebuild_leaderboard(db)
+        DatabaseOperations.update_user_points(db, "board-a", 10**6)
+        DatabaseOperations.update_user_points(db, "board-b", 10**6)
+        DatabaseOperations.update_user_points(db, "board-c", 10**6 + 500)
+        DatabaseOperations.get_user_profile(db, "board-d")
+
+        top = leaderboard.top(3)
+        assert [entry["user_id"] for entry in top] == ["board-c", "board-a", "board-b"]
+        assert [entry["rank"] for entry in top] == [1, 2, 2]
+
+        DatabaseOperations.update_user_points(db, "board-b", 1000)
+        assert leaderboard.rank("board-b")["rank"] == 1
+        assert leaderboard.rank("board-c")["rank"] == 2
+
+        # A rebuild from the database agrees with the incremental updates
+        incremental = leaderboard.top(4)
+        DatabaseOperations.rebuild_leaderboard(db)
+        assert leaderboard.top(4) == incremental
+    finally:
+        db.close()
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    client = TestClient(app)
+    response = client.get("/api/v1/leaderboard", params={"limit": 2, "user_id": "board-a"}).json()
+    assert [entry["user_id"] for entry in response["leaders"]] == ["board-b", "board-c"]
+    assert response["user"]["rank"] == 3
+    assert client.get("/api/v1/leaderboard/board-d").json()["total_points"] == 0
+    assert client.get("/api/v1/leaderboard/nobody").status_code == 404
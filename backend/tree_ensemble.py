@@ -0,0 +1,122 @@
+"""
+Array-backed tree ensembles
+
+Flattens fitted RandomForestRegressor / GradientBoostingRegressor models into
+plain node arrays stored as raw .npy files. Loading them with mmap_mode='r'
+lets every worker on a host share one page-cache copy of the trees instead of
+unpickling its own forest.
+"""
+
+import json
+import os
+import numpy as np
+from typing import Dict, Optional
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+
+ARRAY_NAMES = ('left', 'right', 'feature', 'threshold', 'value', 'roots')
+
+
+def flatten_ensemble(model) -> Dict:
+    """Concatenate every tree of a fitted ensemble into shared node arrays
+
+    Leaves point back to themselves, so walking max_depth steps from a root
+    always ends on a leaf without per-row bookkeeping.
+    """
+    if isinstance(model, RandomForestRegressor):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        scale, bias = 1.0 / len(trees), 0.0
+    elif isinstance(model, GradientBoostingRegressor):
+        trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+        scale = model.learning_rate
+        bias = float(model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0])
+    else:
+        raise TypeError(f"Unsupported ensemble type: {type(model).__name__}")
+
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        value.append(tree.value[:, 0, 0])
+        roots.append(offset)
+        offset += tree.node_count
+
+    return {
+        'arrays': {
+            'left': np.concatenate(left).astype(np.int32),
+            'right': np.concatenate(right).astype(np.int32),
+            'feature': np.concatenate(feature).astype(np.int32),
+            'threshold': np.concatenate(threshold).astype(np.float64),
+            'value': np.concatenate(value).astype(np.float64),
+            'roots': np.array(roots, dtype=np.int32)
+        },
+        'params': {
+            'scale': scale,
+            'bias': bias,
+            'max_depth': max(tree.max_depth for tree in trees),
+            'n_features': int(model.n_features_in_)
+        }
+    }
+
+
+def save_ensemble(model, directory: str):
+    """Write a fitted ensemble as raw .npy node arrays plus a small JSON header"""
+    flat = flatten_ensemble(model)
+    os.makedirs(directory, exist_ok=True)
+    for name, array in flat['arrays'].items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    with open(os.path.join(directory, 'ensemble.json'), 'w') as f:
+        json.dump(flat['params'], f)
+
+
+class TreeEnsemble:
+    """Regression tree ensemble evaluated directly from node arrays"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], params: Dict):
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.scale = params['scale']
+        self.bias = params['bias']
+        self.max_depth = params['max_depth']
+        self.n_features_in_ = params['n_features']
+
+    @classmethod
+    def from_model(cls, model) -> "TreeEnsemble":
+        """Build an in-memory ensemble from a fitted sklearn model"""
+        return cls(**flatten_ensemble(model))
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = 'r') -> "TreeEnsemble":
+        """Load node arrays, memory-mapped read-only by default"""
+        with open(os.path.join(directory, 'ensemble.json')) as f:
+            params = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(arrays, params)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict a batch of rows"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[-1]} features, but the ensemble expects {self.n_features_in_}"
+            )
+
+        # Walk all trees for all rows together; node[r, t] is row r's position in tree t
+        rows = np.arange(len(X))[:, np.newaxis]
+        node = np.tile(self.roots, (len(X), 1))
+        for _ in range(self.max_depth):
+            goes_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(goes_left, self.left[node], self.right[node])
+        return self.bias + self.scale * self.value[node].sum(axis=1)
@@ -0,0 +1,93 @@
+"""
+Write-behind aggregation of community report votes
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from database import get_db_context, DatabaseOperations
+
+logger = logging.getLogger(__name__)
+
+
+class VoteAggregator:
+    """Coalesces bursts of votes per report into periodic batched updates
+
+    A popular report voted on a hundred times between flushes costs one row
+    update instead of a hundred contended ones. Pending increments live only
+    in this worker's memory, so they are flushed on stop and requeued if a
+    flush fails.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or float(os.getenv("VOTE_FLUSH_INTERVAL", 2))
+        self.pending: Counter = Counter()  # report_id -> votes not yet written
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.counts = Counter()
+        self.last_flush: Optional[float] = None
+
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the loop and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def add(self, report_id: int, increment: int = 1):
+        """Record a vote; it reaches the database on the next flush"""
+        if report_id in self.pending:
+            self.counts["coalesced"] += 1
+        self.pending[report_id] += increment
+        self.counts["votes"] += 1
+
+    async def flush(self) -> int:
+        """Write pending increments in one batched update; returns reports updated"""
+        async with self._flush_lock:
+            increments = {report_id: n for report_id, n in self.pending.items() if n}
+            self.pending.clear()
+            if not increments:
+                return 0
+            try:
+                updated = await asyncio.to_thread(self._write, increments)
+            except Exception as e:
+                self.counts["failed_flushes"] += 1
+                logger.error(f"Vote flush for {len(increments)} reports failed: {e}")
+                self.pending.update(increments)
+                return 0
+
+            self.counts["flushes"] += 1
+            self.counts["reports_updated"] += updated
+            self.last_flush = time.time()
+            return updated
+
+    def _write(self, increments: Dict[int, int]) -> int:
+        with get_db_context() as db:
+            return DatabaseOperations.apply_vote_batch(db, increments)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counts,
+            "pending_reports": len(self.pending),
+            "pending_votes": sum(self.pending.values()),
+            "interval": self.interval,
+            "last_flush": self.last_flush
+        }
@@ -1,6 +1,7 @@
--- AQI Readings Table
+-- AQI Readings Table, partitioned by month
+-- Monthly partitions are created ahead of time by rollups.ensure_partitions, at startup and periodically
 CREATE TABLE aqi_readings (
-    id SERIAL PRIMARY KEY,
+    id INTEGER GENERATED BY DEFAULT AS IDENTITY,
     city VARCHAR(100) NOT NULL,
     aqi FLOAT NOT NULL,
     pm25 FLOAT,
@@ -11,10 +12,33 @@ CREATE TABLE aqi_readings (
     o3 FLOAT,
     lat FLOAT,
     lng FLOAT,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_city_timestamp (city, timestamp)
+    timestamp TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Catches readings outside the created monthly partitions
+CREATE TABLE aqi_readings_default PARTITION OF aqi_readings DEFAULT;
+
+CREATE UNIQUE INDEX uq_aqi_readings_city_timestamp ON aqi_readings (city, timestamp DESC);
+CREATE INDEX ix_aqi_readings_timestamp ON aqi_readings (timestamp);
+
+-- Hourly and daily AQI rollups, maintained during ingestion
+-- Per pollutant: reading count, sum, min and max within the bucket
+CREATE TABLE aqi_rollup_hourly (
+    city VARCHAR(100) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    aqi_count INT, aqi_sum FLOAT, aqi_min FLOAT, aqi_max FLOAT,
+    pm25_count INT, pm25_sum FLOAT, pm25_min FLOAT, pm25_max FLOAT,
+    pm10_count INT, pm10_sum FLOAT, pm10_min FLOAT, pm10_max FLOAT,
+    no2_count INT, no2_sum FLOAT, no2_min FLOAT, no2_max FLOAT,
+    so2_count INT, so2_sum FLOAT, so2_min FLOAT, so2_max FLOAT,
+    co_count INT, co_sum FLOAT, co_min FLOAT, co_max FLOAT,
+    o3_count INT, o3_sum FLOAT, o3_min FLOAT, o3_max FLOAT,
+    PRIMARY KEY (city, bucket)
 );
 
+CREATE TABLE aqi_rollup_daily (LIKE aqi_rollup_hourly INCLUDING ALL);
+
 -- Community Reports Table
 CREATE TABLE community_reports (
     id SERIAL PRIMARY KEY,
@@ -27,10 +51,12 @@ CREATE TABLE community_reports (
     lng FLOAT NOT NULL,
     verified BOOLEAN DEFAULT FALSE,
     votes INT DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_location (lat, lng)
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX idx_location ON community_reports (lat, lng);
+CREATE INDEX ix_community_reports_verified_votes ON community_reports (votes DESC) WHERE verified;
+
 -- Policies Table
 CREATE TABLE policies (
     id SERIAL PRIMARY KEY,
@@ -50,10 +76,11 @@ CREATE TABLE user_activity (
     user_id VARCHAR(100) NOT NULL,
     action_type VARCHAR(50),
     points_earned INT DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_user (user_id)
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX ix_user_activity_user_created ON user_activity (user_id, created_at DESC);
+
 -- Predictions Table
 CREATE TABLE predictions (
     id SERIAL PRIMARY KEY,
@@ -64,4 +91,19 @@ CREATE TABLE predictions (
     confidence FLOAT,
     model_version VARCHAR(50),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+CREATE UNIQUE INDEX uq_predictions_city_time_model ON predictions (city, prediction_time, model_version);
+
+-- Forecast Refreshes Table (one claim per city and refresh interval across workers)
+CREATE TABLE forecast_refreshes (
+    city VARCHAR(100) PRIMARY KEY,
+    refreshed_at TIMESTAMP NOT NULL
+);
+
+-- Stats Counters Table (maintained by the write paths, recounted periodically)
+CREATE TABLE stats_counters (
+    name VARCHAR(50) PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP NOT NULL
+);
@@ -1,52 +1,166 @@
 import asyncio
-from typing import Dict, List
+import functools
+import logging
+import time
+from collections import Counter
+from typing import Dict, List, Optional
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from backend.ml_models import AQIPredictionModel
-from backend.data_fetcher import CPCBDataFetcher, WeatherDataFetcher
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+from ml_models import AQIPredictionModel
+from feature_pipeline import RollingFeatureWindow
+from cache import Cache, create_backend
+from data_fetcher import CPCBDataFetcher, WeatherDataFetcher
+
+logger = logging.getLogger(__name__)
 
 class PredictionService:
     """Service for managing AQI predictions"""
     
-    def __init__(self):
-        self.model = AQIPredictionModel(model_path='models/')
-        self.cpcb_fetcher = CPCBDataFetcher()
-        self.weather_fetcher = WeatherDataFetcher()
-        self.cache = {}
+    def __init__(self, model: Optional[AQIPredictionModel] = None,
+                 cpcb_fetcher: Optional[CPCBDataFetcher] = None,
+                 weather_fetcher: Optional[WeatherDataFetcher] = None):
+        self.model = model or AQIPredictionModel(model_path='models/')
+        self.cpcb_fetcher = cpcb_fetcher or CPCBDataFetcher()
+        self.weather_fetcher = weather_fetcher or WeatherDataFetcher()
+        # One longest-horizon forecast is cached per city and sliced for shorter requests
+        self.forecast_horizon = self.model.max_horizon
         self.cache_duration = 3600  # 1 hour cache
+        self.stale_duration = 3600  # serve expired forecasts this much longer while refreshing
+        # Forecasts live in L1 per worker and, with CACHE_L2_URL set, in a tier shared by all workers
+        self.cache = Cache(
+            default_ttl=self.cache_duration + self.stale_duration,
+            l2=create_backend(os.getenv("CACHE_L2_URL"))
+        )
+        self.cache_stats = Counter()
+        self.windows: Dict[str, RollingFeatureWindow] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def get_predictions(self, city: str, hours: int = 48) -> Dict:
         """Get AQI predictions for a city"""
+        results = await self.batch_predict([city], hours)
+        return results[city]
+    
+    def observe(self, reading: Dict):
+        """Fold a stored reading into its city's live feature window"""
+        window = self.windows.get(reading['city'])
+        if window is not None:
+            window.observe(reading, reading['timestamp'])
+    
+    async def refresh(self, cities: List[str]) -> Dict[str, Dict]:
+        """Recompute full-horizon forecasts for cities now, whatever their cache state"""
+        tasks = {city: self._inflight[city] for city in cities if city in self._inflight}
+        missing = [city for city in cities if city not in tasks]
+        if missing:
+            tasks.update(self._start_forecast(missing))
+        return {city: await asyncio.shield(task) for city, task in tasks.items()}
+    
+    def get_cache_stats(self) -> Dict:
+        """Hit, stale hit, miss, coalesced and background refresh counts"""
+        return dict(self.cache_stats)
+    
+    async def forecast_age(self, city: str) -> Optional[float]:
+        """Seconds since the newest cached forecast for city was generated, by any worker"""
+        entry = await self._newest_entry(city)
+        return None if entry is None else time.time() - entry[1]
+    
+    async def _newest_entry(self, city: str):
+        """Cached (result, generated_at), preferring the shared tier's if L1 is no longer fresh"""
+        key = f"forecast:{city}"
+        entry = await self.cache.aget(key)
+        if entry is not None and not self._is_fresh(entry):
+            # Another worker may already have refreshed it in the shared tier
+            shared = await self.cache.aget_shared(key)
+            if shared is not None and shared[1] > entry[1]:
+                entry = shared
+        return entry
+    
+    async def _lookup(self, city: str):
+        """Return (cached_data, is_fresh), or None if missing or too stale to serve"""
+        entry = await self._newest_entry(city)
+        if entry is None:
+            return None
+        cached_data, timestamp = entry
+        # Wall-clock age, since the entry may have been written by another worker
+        age = time.time() - timestamp
+        if age < self.cache_duration:
+            return cached_data, True
+        if age < self.cache_duration + self.stale_duration:
+            return cached_data, False
+        return None
+    
+    def _is_fresh(self, entry) -> bool:
+        return time.time() - entry[1] < self.cache_duration
+    
+    def _start_forecast(self, cities: List[str]) -> Dict[str, asyncio.Task]:
+        """Start one batched forecast for cities and register each as in flight"""
+        batch = asyncio.ensure_future(self._forecast_batch(cities))
+        tasks = {}
+        for city in cities:
+            task = asyncio.ensure_future(self._pick(batch, city))
+            task.add_done_callback(functools.partial(self._finish_forecast, city))
+            self._inflight[city] = task
+            tasks[city] = task
+        return tasks
+    
+    async def _pick(self, batch: asyncio.Task, city: str) -> Dict:
+        results = await batch
+        return results[city]
+    
+    def _finish_forecast(self, city: str, task: asyncio.Task):
+        """Drop a finished forecast from the in-flight table"""
+        if self._inflight.get(city) is task:
+            del self._inflight[city]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Forecast for {city} failed: {task.exception()}")
+    
+    async def _fetch_inputs(self, city: str, hours: int):
+        """Get the live feature window and the weather forecast a prediction needs"""
+        window = self.windows.get(city)
+        if window is None:
+            # Seed the window from the hourly rollups once; after that observe() keeps it current
+            hourly = await self.cpcb_fetcher.fetch_hourly_history(city, hours=self.model.sequence_length)
+            window = self.windows.setdefault(
+                city, RollingFeatureWindow(self.model.sequence_length, self.model.n_features)
+            )
+            if window.hour is None:
+                for row in hourly:
+                    window.observe(row, row['date'])
         
-        # Check cache
-        cache_key = f"{city}_{hours}"
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if (asyncio.get_event_loop().time() - timestamp) < self.cache_duration:
-                return cached_data
-        
-        # Fetch data
-        historical_data = await self.cpcb_fetcher.fetch_historical(city, days=30)
         weather_forecast = await self.weather_fetcher.fetch_forecast(city, hours=hours)
-        
-        # Generate predictions
-        predictions = await self.model.predict(
-            historical_data=historical_data,
-            weather_forecast=weather_forecast,
+        return window.to_array(), weather_forecast
+    
+    async def _forecast_batch(self, cities: List[str]) -> Dict[str, Dict]:
+        """Forecast cities over the full horizon in one batched rollout and cache the results"""
+        hours = self.forecast_horizon
+        inputs = await asyncio.gather(*[self._fetch_inputs(city, hours) for city in cities])
+        forecasts = await self.model.predict_windows(
+            sequences=np.stack([window for window, _ in inputs]),
+            weather_batch=[weather for _, weather in inputs],
             hours=hours
         )
-        
+        return {
+            city: await self._store_result(city, predictions)
+            for city, predictions in zip(cities, forecasts)
+        }
+    
+    def _slice(self, result: Dict, hours: int) -> Dict:
+        """View of a cached full-horizon forecast limited to the first hours"""
+        return {**result, "predictions": result["predictions"][:hours]}
+    
+    async def _store_result(self, city: str, predictions: List[Dict]) -> Dict:
+        """Wrap predictions in a response and cache it"""
         result = {
             "city": city,
             "predictions": predictions,
             "model_accuracy": self.model.get_accuracy(),
             "confidence_interval": self.model.get_confidence_interval(),
-            "generated_at": asyncio.get_event_loop().time()
+            "generated_at": time.time()
         }
         
         # Update cache
-        self.cache[cache_key] = (result, asyncio.get_event_loop().time())
+        await self.cache.aset(f"forecast:{city}", (result, result["generated_at"]))
         
         return result
     
@@ -79,11 +193,54 @@ class PredictionService:
             return "Moderate air quality. Take usual precautions."
     
     async def batch_predict(self, cities: List[str], hours: int = 48) -> Dict[str, Dict]:
-        """Get predictions for multiple cities"""
-        tasks = [self.get_predictions(city, hours) for city in cities]
-        results = await asyncio.gather(*tasks)
+        """Get predictions for multiple cities
+        
+        Every city is forecast once over the full horizon and sliced to hours
+        (1-72), so requests for different horizons share one computation.
+        Fresh entries are served from the cache. Expired entries are served
+        stale while a single background refresh runs, concurrent misses for the
+        same city await the forecast already in flight, and the remaining
+        cities are forecast together in one batched rollout.
+        """
+        results = {}
+        waiting = {}
+        pending = []
+        stale = []
+        
+        for city in dict.fromkeys(cities):
+            cached = await self._lookup(city)
+            if cached is not None:
+                results[city], is_fresh = cached
+                if is_fresh:
+                    self.cache_stats['hits'] += 1
+                else:
+                    self.cache_stats['stale_hits'] += 1
+                    stale.append(city)
+            else:
+                pending.append(city)
+        
+        # Lookups may have awaited the shared tier, so decide on in-flight
+        # forecasts only now: nothing below yields before they are registered
+        stale = [city for city in stale if city not in self._inflight]
+        for city in pending:
+            if city in self._inflight:
+                self.cache_stats['coalesced'] += 1
+                waiting[city] = self._inflight[city]
+            else:
+                self.cache_stats['misses'] += 1
+        pending = [city for city in pending if city not in waiting]
+        
+        if stale:
+            self.cache_stats['refreshes'] += 1
+            self._start_forecast(stale)
+        if pending:
+            waiting.update(self._start_forecast(pending))
+        
+        # Shield shared forecasts so one cancelled request does not cancel them for everyone
+        for city, task in waiting.items():
+            results[city] = await asyncio.shield(task)
         
-        return {result['city']: result for result in results}
+        return {city: self._slice(results[city], hours) for city in dict.fromkeys(cities)}
 
 # Example usage
 async def main():
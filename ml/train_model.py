@@ -1,15 +1,18 @@
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import MinMaxScaler
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from backend.ml_models import AQIPredictionModel
-from datetime import datetime, timedelta
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+from ml_models import AQIPredictionModel
 
-def generate_synthetic_training_data(n_samples=10000, sequence_length=24):
-    """Generate synthetic training data for model training"""
+def generate_synthetic_training_data(n_samples=10000, sequence_length=24, horizons=72):
+    """Generate synthetic training data for model training
+    
+    Targets hold the AQI for each of the next `horizons` hours; the first
+    column is the next-hour target used by the recursive models.
+    """
     print(f"Generating {n_samples} synthetic training samples...")
     
     X = []
@@ -45,12 +48,13 @@ def generate_synthetic_training_data(n_samples=10000, sequence_length=24):
             ]
             sequence.append(features)
         
-        # Target is next hour's AQI
-        next_aqi = aqi_sequence[-1] + trend + np.random.normal(0, 15)
-        next_aqi = np.clip(next_aqi, 50, 450)
+        # Targets are the AQI for each of the following hours
+        steps = np.arange(1, horizons + 1)
+        future_aqi = aqi_sequence[-1] + trend * steps + np.random.normal(0, 15, horizons)
+        future_aqi = np.clip(future_aqi, 50, 450)
         
         X.append(sequence)
-        y.append(next_aqi)
+        y.append(future_aqi)
     
     return np.array(X), np.array(y)
 
@@ -67,7 +71,7 @@ def load_real_data_if_available(data_path="data/historical_aqi.csv"):
         return None, None
 
 def prepare_training_data(sequence_length=24):
-    """Prepare training, validation, and test sets"""
+    """Prepare training, validation, and test sets with multi-horizon targets"""
     
     # Try to load real data first
     X_real, y_real = load_real_data_if_available()
@@ -88,13 +92,54 @@ def prepare_training_data(sequence_length=24):
     
     return X_train, X_val, X_test, y_train, y_val, y_test
 
+def random_weather_forecast(n_samples, hours):
+    """Weather forecast (temp, humidity, wind speed) matching the synthetic features"""
+    return np.stack([
+        np.random.uniform(15, 35, (n_samples, hours)),
+        np.random.uniform(30, 80, (n_samples, hours)),
+        np.random.uniform(5, 20, (n_samples, hours))
+    ], axis=-1)
+
+def evaluate_horizons(model, X_test, Y_test, report_horizons=(1, 6, 12, 24, 48, 72)):
+    """Compare the recursive rollout and the direct model across forecast horizons"""
+    hours = Y_test.shape[1]
+    
+    start = time.perf_counter()
+    recursive_preds = model._rollout(X_test, random_weather_forecast(len(X_test), hours))
+    recursive_latency = (time.perf_counter() - start) / len(X_test)
+    
+    start = time.perf_counter()
+    direct_preds = model._direct_forecast(X_test, hours)
+    direct_latency = (time.perf_counter() - start) / len(X_test)
+    
+    rows = []
+    for name, preds, latency in [('recursive', recursive_preds, recursive_latency),
+                                 ('direct', direct_preds, direct_latency)]:
+        for horizon in report_horizons:
+            errors = np.abs(preds[:, horizon - 1] - Y_test[:, horizon - 1])
+            rows.append({
+                'mode': name,
+                'horizon': horizon,
+                'mae': np.mean(errors),
+                'accuracy': np.mean(errors <= Y_test[:, horizon - 1] * 0.2) * 100,
+                'latency_ms': latency * 1000
+            })
+    
+    results = pd.DataFrame(rows)
+    print("\n" + "="*50)
+    print("RECURSIVE VS DIRECT FORECASTING")
+    print("="*50)
+    print(results.pivot(index='horizon', columns='mode', values=['mae', 'accuracy']).round(2))
+    print(f"Latency per {hours}h forecast (batched): "
+          f"recursive {recursive_latency * 1000:.3f} ms, direct {direct_latency * 1000:.3f} ms")
+    print("="*50 + "\n")
+    
+    return results
+
 def evaluate_model(model, X_test, y_test):
     """Evaluate model performance"""
     from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
     
-    # Reshape for ensemble models
-    X_test_flat = X_test.reshape(X_test.shape[0], -1)
-    
     # LSTM predictions
     lstm_preds = model.lstm_model.predict(X_test, verbose=0).flatten()
     
@@ -140,29 +185,38 @@ def main():
     
     # Prepare data
     print("\nPreparing training data...")
-    X_train, X_val, X_test, y_train, y_val, y_test = prepare_training_data()
+    X_train, X_val, X_test, Y_train, Y_val, Y_test = prepare_training_data()
     
     # Train model
     print("\nStarting model training...")
     print("This may take several minutes...\n")
     
-    history = model.train(
-        X_train, y_train,
-        X_val, y_val,
+    model.train(
+        X_train, Y_train[:, 0],
+        X_val, Y_val[:, 0],
+        epochs=50
+    )
+    
+    print("\nStarting direct multi-horizon model training...")
+    model.train_direct(
+        X_train, Y_train,
+        X_val, Y_val,
         epochs=50
     )
     
     # Evaluate model
     print("\nEvaluating model performance...")
-    metrics = evaluate_model(model, X_test, y_test)
+    metrics = evaluate_model(model, X_test, Y_test[:, 0])
+    horizon_metrics = evaluate_horizons(model, X_test, Y_test)
     
     # Save metrics
     metrics_df = pd.DataFrame([metrics])
     metrics_df.to_csv('models/training_metrics.csv', index=False)
+    horizon_metrics.to_csv('models/horizon_metrics.csv', index=False)
     
     print("\nTraining completed successfully!")
-    print(f"Models saved to: models/")
-    print(f"Metrics saved to: models/training_metrics.csv")
+    print("Models saved to: models/")
+    print("Metrics saved to: models/training_metrics.csv, models/horizon_metrics.csv")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+AQI reading ingestion benchmark
+Usage: python scripts/benchmark_ingest.py [rows]
+
+Compares per-row DatabaseOperations.store_aqi_reading with the batched
+bulk_store_aqi_readings path in rows/sec against DATABASE_URL (a throwaway
+SQLite file when unset). Results are saved to models/ingest_benchmark.csv.
+"""
+
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'ingest_benchmark.db')}"
+)
+
+from database import engine, init_db, SessionLocal, AQIReading, DatabaseOperations
+from city_registry import city_registry
+
+
+def generate_readings(n_rows):
+    """Synthetic station readings cycling through every city"""
+    rng = np.random.default_rng(0)
+    start = datetime.utcnow()
+    aqi = rng.uniform(50, 450, n_rows)
+    for i in range(n_rows):
+        city = i % len(city_registry)
+        yield {
+            "city": city_registry.names[city],
+            "aqi": float(aqi[i]),
+            "pm25": float(aqi[i] * 0.6),
+            "pm10": float(aqi[i] * 0.8),
+            "no2": float(aqi[i] * 0.15),
+            "so2": float(aqi[i] * 0.08),
+            "co": float(aqi[i] * 0.01),
+            "o3": float(aqi[i] * 0.12),
+            "lat": float(city_registry.lat[city]),
+            "lng": float(city_registry.lng[city]),
+            "timestamp": start + timedelta(seconds=i)
+        }
+
+
+def run_benchmark(n_rows=20000, per_row_limit=2000):
+    """Ingest n_rows in bulk and up to per_row_limit rows one at a time"""
+    init_db()
+    db = SessionLocal()
+    rows = []
+    try:
+        db.query(AQIReading).delete()
+        db.commit()
+
+        per_row = min(n_rows, per_row_limit)
+        start = time.perf_counter()
+        for reading in generate_readings(per_row):
+            DatabaseOperations.store_aqi_reading(db, reading)
+        seconds = time.perf_counter() - start
+        rows.append({'method': 'store_aqi_reading', 'rows': per_row,
+                     'seconds': seconds, 'rows_per_sec': per_row / seconds})
+
+        for batch_size in (1000, 5000):
+            db.query(AQIReading).delete()
+            db.commit()
+            result = DatabaseOperations.bulk_store_aqi_readings(
+                db, generate_readings(n_rows), batch_size=batch_size
+            )
+            rows.append({'method': f'bulk_store_aqi_readings (batch {batch_size})', **result})
+    finally:
+        db.close()
+
+    results = pd.DataFrame(rows)
+    results['speedup'] = results['rows_per_sec'] / results['rows_per_sec'].iloc[0]
+
+    print("\n" + "="*80)
+    print(f"AQI READING INGESTION ({engine.dialect.name})")
+    print("="*80)
+    print(results.round(2).to_string(index=False))
+    print("="*80 + "\n")
+
+    os.makedirs('models', exist_ok=True)
+    results.to_csv('models/ingest_benchmark.csv', index=False)
+    print("Results saved to: models/ingest_benchmark.csv")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(n_rows=int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,71 @@
+"""
+LSTM inference microbenchmark
+Usage: python scripts/benchmark_lstm.py [calls]
+
+Compares the per-call latency of keras.Model.predict with the graph-compiled
+CompiledLSTM path used by AQIPredictionModel and records the results in
+models/lstm_latency.csv.
+"""
+
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from ml_models import AQIPredictionModel
+
+
+def time_calls(fn, sequences, calls):
+    """Return per-call latencies in milliseconds"""
+    fn(sequences)  # exclude one-off tracing from the measurement
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn(sequences)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def run_benchmark(calls=200, batch_sizes=(1, 10)):
+    """Benchmark both inference paths for each batch size"""
+    model = AQIPredictionModel(model_path='models/')
+    paths = {
+        'keras_predict': lambda x: model.lstm_model.predict(x, verbose=0),
+        'compiled': model.lstm_infer
+    }
+    
+    rows = []
+    for batch_size in batch_sizes:
+        sequences = np.random.rand(
+            batch_size, model.sequence_length, model.n_features
+        ).astype(np.float32)
+        for name, fn in paths.items():
+            latencies = time_calls(fn, sequences, calls)
+            rows.append({
+                'path': name,
+                'batch_size': batch_size,
+                'calls': calls,
+                'mean_ms': latencies.mean(),
+                'p50_ms': np.percentile(latencies, 50),
+                'p99_ms': np.percentile(latencies, 99)
+            })
+    
+    results = pd.DataFrame(rows)
+    
+    print("\n" + "="*60)
+    print("LSTM INFERENCE LATENCY (per call)")
+    print("="*60)
+    print(results.round(3).to_string(index=False))
+    print("="*60 + "\n")
+    
+    os.makedirs('models', exist_ok=True)
+    results.to_csv('models/lstm_latency.csv', index=False)
+    print("Results saved to: models/lstm_latency.csv")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(calls=int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,79 @@
+"""
+Tree ensemble evaluator benchmark
+Usage: python scripts/benchmark_trees.py [samples]
+
+Fits the RF/GB ensembles with AQIPredictionModel's hyperparameters on synthetic
+windows and compares sklearn predict with the array-backed TreeEnsemble in
+rows/sec across batch sizes. Results are saved to models/tree_benchmark.csv.
+"""
+
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from ml_models import AQIPredictionModel
+from tree_ensemble import TreeEnsemble
+from ml.train_model import generate_synthetic_training_data
+
+
+def rows_per_second(predict, X, min_seconds=1.0):
+    """Call predict repeatedly for at least min_seconds and return throughput"""
+    predict(X)  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        predict(X)
+        calls += 1
+    return calls * len(X) / (time.perf_counter() - start)
+
+
+def run_benchmark(n_samples=2000, batch_sizes=(1, 10, 100, 1000)):
+    """Benchmark sklearn and TreeEnsemble for each ensemble member"""
+    model = AQIPredictionModel.__new__(AQIPredictionModel)
+    model._initialize_ensemble_models()
+
+    X, Y = generate_synthetic_training_data(n_samples=n_samples)
+    X_flat = X.reshape(len(X), -1)
+
+    rows = []
+    for name, estimator in [('random_forest', model.rf_model),
+                            ('gradient_boosting', model.gb_model)]:
+        print(f"Fitting {name}...")
+        estimator.fit(X_flat, Y[:, 0])
+        ensemble = TreeEnsemble.from_model(estimator)
+
+        max_error = np.abs(ensemble.predict(X_flat) - estimator.predict(X_flat)).max()
+        for batch_size in batch_sizes:
+            batch = X_flat[:batch_size]
+            sklearn_rate = rows_per_second(estimator.predict, batch)
+            arrays_rate = rows_per_second(ensemble.predict, batch)
+            rows.append({
+                'model': name,
+                'batch_size': batch_size,
+                'sklearn_rows_per_sec': sklearn_rate,
+                'arrays_rows_per_sec': arrays_rate,
+                'speedup': arrays_rate / sklearn_rate,
+                'max_abs_error': max_error
+            })
+
+    results = pd.DataFrame(rows)
+
+    print("\n" + "="*80)
+    print("TREE ENSEMBLE THROUGHPUT (rows/sec)")
+    print("="*80)
+    print(results.round(2).to_string(index=False))
+    print("="*80 + "\n")
+
+    os.makedirs('models', exist_ok=True)
+    results.to_csv('models/tree_benchmark.csv', index=False)
+    print("Results saved to: models/tree_benchmark.csv")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(n_samples=int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
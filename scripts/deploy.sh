@@ -90,6 +90,7 @@ fi
 # Run database migrations (if needed)
 print_status "Running database migrations..."
 docker-compose exec backend python scripts/manage_db.py init
+docker-compose exec backend python scripts/manage_db.py migrate
 
 # Show running containers
 print_status "Running containers:"
@@ -4,7 +4,7 @@
 """
 Database management utility script
 Usage: python scripts/manage_db.py [command]
-Commands: init, seed, reset, backup, migrate
+Commands: init, seed, reset, backup, migrate [--drop-duplicates]
 """
 
 import sys
@@ -12,9 +12,10 @@ import os
 from datetime import datetime
 import subprocess
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
-from database import init_db, drop_db, SessionLocal
+from database import init_db, drop_db, SessionLocal, engine, DatabaseOperations
+from migrations import migrate
 from sqlalchemy import text
 
 
@@ -74,6 +75,22 @@ def reset_database():
         return False
 
 
+def migrate_database(drop_duplicates='--drop-duplicates' in sys.argv):
+    """Bring indexes on an existing database up to date"""
+    print("Migrating database...")
+    try:
+        applied = migrate(engine, drop_duplicates=drop_duplicates)
+        for change in applied:
+            print(f"  {change}")
+        if any(change.startswith("skipped") for change in applied):
+            print("⚠ Unique indexes were skipped; rerun with --drop-duplicates to keep the newest row per key")
+        print(f"✓ Database migrated ({len(applied)} changes)")
+        return True
+    except Exception as e:
+        print(f"✗ Error migrating database: {e}")
+        return False
+
+
 def backup_database():
     """Create database backup"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -113,18 +130,18 @@ def backup_database():
         return False
 
 
-def show_stats():
-    """Show database statistics"""
+def show_stats(max_staleness=float(os.getenv("STATS_MAX_STALENESS", 300))):
+    """Show database statistics from the same counters /stats serves"""
     try:
         db = SessionLocal()
         
-        from database import AQIReading, CommunityReport, UserProfile, Policy
-        
+        counts, refreshed_at = DatabaseOperations.get_stats_counters(db, max_staleness)
         stats = {
-            "AQI Readings": db.query(AQIReading).count(),
-            "Community Reports": db.query(CommunityReport).count(),
-            "User Profiles": db.query(UserProfile).count(),
-            "Policies": db.query(Policy).count()
+            "AQI Readings": counts["aqi_readings"],
+            "Community Reports": counts["community_reports"],
+            "Verified Reports": counts["verified_reports"],
+            "User Profiles": counts["user_profiles"],
+            "Policies": counts["policies"]
         }
         
         print("\n" + "="*40)
@@ -132,6 +149,7 @@ def show_stats():
         print("="*40)
         for key, value in stats.items():
             print(f"{key:20s}: {value:>10,}")
+        print(f"{'Counted at':20s}: {refreshed_at:%Y-%m-%d %H:%M:%S} UTC")
         print("="*40 + "\n")
         
         db.close()
@@ -149,6 +167,8 @@ def main():
         print("  init    - Initialize database tables")
         print("  seed    - Seed database with sample data")
         print("  reset   - Reset database (drop and recreate)")
+        print("  migrate - Create missing indexes on an existing database")
+        print("            (--drop-duplicates removes rows blocking a unique index)")
         print("  backup  - Create database backup")
         print("  stats   - Show database statistics")
         return
@@ -159,6 +179,7 @@ def main():
         'init': init_database,
         'seed': seed_database,
         'reset': reset_database,
+        'migrate': migrate_database,
         'backup': backup_database,
         'stats': show_stats
     }
@@ -167,7 +188,7 @@ def main():
         commands[command]()
     else:
         print(f"Unknown command: {command}")
-        print("Available commands: init, seed, reset, backup, stats")
+        print("Available commands: init, seed, reset, migrate, backup, stats")
 
 
 if __name__ == "__main__":